@@ -0,0 +1 @@
+# Benchmarks del motor de exportación contra un CRM simulado (ver bench/run_bench.py).
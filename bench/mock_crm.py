@@ -0,0 +1,158 @@
+# --- CRM Simulado para Benchmarks ---
+# Servidor HTTP local que imita los endpoints que usa el motor: login y ordermanager de
+# custom/apps/api.php, archivos de anexos y páginas de links (PDF directo, HTML con iframe o
+# HTML plano). Latencia, tamaño de las respuestas y tasa de errores son configurables.
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+DEFAULT_MOCK_SETTINGS = {
+    "latency_ms": 20.0,           # Latencia media añadida a cada respuesta
+    "jitter_ms": 10.0,            # Variación uniforme (+/-) sobre la latencia
+    "orders_per_cedula": 2,
+    "attachments_per_order": 2,
+    "links_per_order": 1,
+    "attachment_kb": 256,         # Tamaño de cada anexo (contenido PDF no comprimible)
+    "html_kb": 8,                 # Tamaño de las páginas HTML de los links/iframes
+    "link_pdf_ratio": 0.3,        # Fracción de links que devuelven un PDF directo
+    "link_iframe_ratio": 0.5,     # Fracción de links HTML con iframe (el resto, HTML plano)
+    "capacity": 0,                # Peticiones que el servidor atiende a la vez (0 = sin límite); el resto espera en cola
+    "reject_over_capacity": False,  # Con capacidad llena, responder `error_status` (con Retry-After) en vez de encolar
+    "error_rate": 0.0,            # Probabilidad de responder `error_status` en cualquier petición
+    "error_status": 503,
+    "retry_after_seconds": 0,     # Se envía Retry-After (segundos enteros) con los 429/503 si es > 0
+    "seed": 1234,
+}
+
+class MockCRM:
+    """Servidor en un hilo propio; `base_url` sirve como 'api_base_url' del entorno."""
+    def __init__(self, settings=None, host="127.0.0.1", port=0):
+        self.settings = dict(DEFAULT_MOCK_SETTINGS, **(settings or {}))
+        self._rng = random.Random(self.settings["seed"]); self._lock = threading.Lock(); self.counters = {}; self._tokens = set()
+        self._capacity = threading.BoundedSemaphore(int(self.settings["capacity"])) if self.settings["capacity"] > 0 else None
+        # Contenidos generados una vez y reutilizados (el coste de generarlos no cuenta en la medición)
+        self.attachment_body = b"%PDF-1.4\n" + self._rng.randbytes(max(0, int(self.settings["attachment_kb"] * 1024) - 9))
+        paragraph = "<p>Orden de servicio: detalle de la gestión realizada y observaciones del técnico.</p>\n"
+        self._html_body = paragraph * max(1, int(self.settings["html_kb"] * 1024) // len(paragraph))
+        mock = self
+        class Handler(_Handler): crm = mock
+        self.server = ThreadingHTTPServer((host, port), Handler); self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.server.server_address[0]}:{self.server.server_address[1]}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-crm", daemon=True); self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown(); self.server.server_close()
+
+    def __enter__(self): return self.start()
+    def __exit__(self, *exc_info): self.stop()
+
+    def count(self, name):
+        with self._lock: self.counters[name] = self.counters.get(name, 0) + 1
+
+    def should_fail(self):
+        with self._lock: return self.settings["error_rate"] > 0 and self._rng.random() < self.settings["error_rate"]
+
+    def delay(self):
+        # False si el servidor está lleno y rechaza la petición
+        settings = self.settings
+        with self._lock: jitter = self._rng.uniform(-settings["jitter_ms"], settings["jitter_ms"])
+        if self._capacity is None: time.sleep(max(0.0, settings["latency_ms"] + jitter) / 1000); return True
+        if not self._capacity.acquire(blocking=not settings["reject_over_capacity"]): self.count("over_capacity"); return False
+        try: time.sleep(max(0.0, settings["latency_ms"] + jitter) / 1000); return True
+        finally: self._capacity.release()
+
+    def new_token(self):
+        with self._lock: token = f"bench-{self._rng.getrandbits(64):016x}"; self._tokens.add(token)
+        return token
+
+    def is_valid_token(self, token):
+        with self._lock: return token in self._tokens
+
+    def link_kind(self, link_id):
+        # Determinista por link: el mismo escenario produce siempre la misma mezcla
+        fraction = int(hashlib.sha256(link_id.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+        if fraction < self.settings["link_pdf_ratio"]: return "pdf"
+        return "iframe" if fraction < self.settings["link_pdf_ratio"] + self.settings["link_iframe_ratio"] else "html"
+
+    def html_page(self, title):
+        return f"<html><head><title>{title}</title></head><body><h1>{title}</h1>\n{self._html_body}</body></html>".encode("utf-8")
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, igual que el CRM real
+    crm = None
+
+    def log_message(self, *args): pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length: return {}
+        try: return json.loads(self.rfile.read(length))
+        except ValueError: return {}
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        if isinstance(body, (dict, list)): body = json.dumps(body).encode("utf-8")
+        self.send_response(status); self.send_header("Content-Type", content_type); self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items(): self.send_header(name, value)
+        self.end_headers(); self.wfile.write(body)
+
+    def _fail(self):
+        settings = self.crm.settings; status = int(settings["error_status"]); self.crm.count(f"error_{status}")
+        retry_after = settings["retry_after_seconds"]
+        headers = {"Retry-After": str(int(retry_after))} if retry_after > 0 and status in (429, 503) else None
+        self._send(status, {"status": "ERROR", "message": "simulated"}, headers=headers)
+
+    def do_POST(self):
+        payload = self._read_json(); url = urlparse(self.path)
+        if not self.crm.delay(): return self._fail()
+        if url.path.endswith("custom/apps/api.php") and "login" in parse_qs(url.query, keep_blank_values=True):
+            self.crm.count("login")
+            if self.crm.should_fail(): return self._fail()
+            if not payload.get("username") or not payload.get("password"): return self._send(401, {"status": "ERROR"})
+            return self._send(200, {"token": self.crm.new_token(), "expires_in": 3600})
+        self._send(404, {"status": "ERROR"})
+
+    def do_GET(self):
+        payload = self._read_json(); url = urlparse(self.path); crm = self.crm; settings = crm.settings
+        if not crm.delay(): return self._fail()
+        token = (self.headers.get("Authorization") or "").removeprefix("Bearer ")
+        if not crm.is_valid_token(token): crm.count("unauthorized"); return self._send(401, {"status": "ERROR", "message": "token"})
+        if crm.should_fail(): return self._fail()
+        if url.path.endswith("custom/apps/api.php"):
+            if "order-keyword" in payload:
+                crm.count("orders"); cedula = payload["order-keyword"]
+                # Fallo dirigido (pruebas): settings["fail_orders_for"] = {cédulas cuya consulta responde 500}
+                if cedula in settings.get("fail_orders_for", ()): return self._send(500, {"status": "ERROR", "message": "simulated"})
+                records = [{"ID": f"{cedula}-{index}", "Carrier": "BENCH"} for index in range(settings["orders_per_cedula"])]
+                return self._send(200, {"status": "OK", "data": {"existing-orders": {"Records": records}}})
+            if "order-id" in payload:
+                crm.count("details"); order_id = payload["order-id"]
+                attachments = [{"ID": f"{order_id}-a{index}", "FileName": f"anexo{index}.pdf", "FolderPath": "/files/ordenes/"}
+                               for index in range(settings["attachments_per_order"])]
+                links = [{"Name": f"Informe {index}", "URL": f"/links/{order_id}-l{index}"} for index in range(settings["links_per_order"])]
+                return self._send(200, {"status": "OK", "data": {"existing-orders": {"Attachments": attachments, "Links": links}}})
+            return self._send(200, {"status": "ERROR"})
+        if url.path.startswith("/files/"):
+            crm.count("attachments")
+            # Fallo dirigido (pruebas): settings["fail_files"] = {fragmentos de ruta de anexos que responden 500}
+            if any(fragment in url.path for fragment in settings.get("fail_files", ())): return self._send(500, {"status": "ERROR"})
+            return self._send(200, crm.attachment_body, "application/pdf")
+        if url.path.startswith("/links/"):
+            crm.count("links"); link_id = url.path.rsplit("/", 1)[-1]; kind = crm.link_kind(link_id)
+            if kind == "pdf": return self._send(200, crm.attachment_body, "application/pdf")
+            if kind == "iframe":
+                return self._send(200, f'<html><body><iframe src="/frames/{link_id}"></iframe></body></html>'.encode("utf-8"), "text/html; charset=utf-8")
+            return self._send(200, crm.html_page(link_id), "text/html; charset=utf-8")
+        if url.path.startswith("/frames/"):
+            crm.count("iframes"); return self._send(200, crm.html_page(url.path.rsplit("/", 1)[-1]), "text/html; charset=utf-8")
+        self._send(404, {"status": "ERROR"})
@@ -0,0 +1,133 @@
+# --- Benchmark de Exportación contra el CRM Simulado ---
+# Uso (desde la raíz del repositorio):
+#   python -m bench.run_bench --scenarios 1,10,100,1000,5000 --latency-ms 20 --attachment-kb 256 \
+#       [--error-rate 0.01] [--set phase2_workers=16] [--json bench_results.json]
+#
+# Levanta bench/mock_crm.py y ejecuta cada escenario (N cédulas) en un subproceso propio con el
+# motor real (login, pipeline de Fase 1/Fase 2, conversión a PDF y armado del ZIP), para que el
+# pico de memoria de un escenario no contamine al siguiente. Informa elementos/s, MB/s, pico de
+# RSS y tiempo por fase, tomados del reporte de métricas de la ejecución (sugos/metrics.py).
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import subprocess
+import tempfile
+
+from bench.mock_crm import DEFAULT_MOCK_SETTINGS, MockCRM
+
+DEFAULT_SCENARIOS = "1,10,100,1000,5000"
+CEDULA_BASE = 10_000_000
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss viene en KiB en Linux y en bytes en macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+def parse_overrides(pairs):
+    """'clave=valor' -> dict; los valores se interpretan como JSON si es posible (números, listas)."""
+    overrides = {}
+    for pair in pairs or []:
+        key, separator, value = pair.partition("=")
+        if not separator: raise SystemExit(f"--set espera clave=valor, no '{pair}'")
+        try: overrides[key.strip()] = json.loads(value)
+        except ValueError: overrides[key.strip()] = value
+    return overrides
+
+def bench_config(base_url, cache_dir, overrides):
+    # Cachés locales desactivadas por defecto: se mide el camino completo contra el CRM
+    config = {
+        "display_name": "Benchmark", "api_base_url": base_url, "app_cfn": "bench", "cache_dir": cache_dir,
+        "attachment_cache_max_mb": 0, "pdf_cache_max_mb": 0, "listing_cache_ttl_seconds": 0,
+    }
+    config.update(overrides); return config
+
+def run_scenario(cedula_count, config):
+    """Ejecuta una exportación completa en este proceso y devuelve el resultado del escenario."""
+    from sugos import metrics, pdf_render, report
+    from sugos.archive import ExportArchive
+    from sugos.crm import get_api_token, get_rate_limiter
+    from sugos.export import run_export_pipeline
+
+    cedulas = [str(CEDULA_BASE + index) for index in range(cedula_count)]
+    run_metrics = metrics.RunMetrics(); zip_bytes = 0
+    with report.using(report.LogReporter()), metrics.using(run_metrics):
+        token = get_api_token("bench", "bench", config)
+        if not token: raise SystemExit("El CRM simulado rechazó el login.")
+        with ExportArchive(config) as export_archive:
+            _, total_items, processed_count, error_count = run_export_pipeline(token, cedulas, config, export_archive)
+        for zip_part in export_archive.parts: zip_part.seek(0, os.SEEK_END); zip_bytes += zip_part.tell(); zip_part.close()
+    pdf_render.shutdown_pools()
+    summary = run_metrics.summary(items={"total": total_items, "processed": processed_count, "errors": error_count})
+    downloaded = sum(values["bytes"] for values in summary["requests"].values())
+    return {
+        "cedulas": cedula_count, "items": total_items, "processed": processed_count, "errors": error_count,
+        "retries": sum(values["retries"] for values in summary["requests"].values()),
+        "wall_seconds": summary["wall_seconds"], "items_per_second": summary["items"]["items_per_second"],
+        "downloaded_mb": round(downloaded / (1024 * 1024), 2),
+        "mb_per_second": round(downloaded / (1024 * 1024) / summary["wall_seconds"], 2) if summary["wall_seconds"] else 0,
+        "zip_mb": round(zip_bytes / (1024 * 1024), 2), "zip_parts": len(export_archive.parts),
+        "peak_rss_mb": peak_rss_mb(), "peak_rss_pdf_workers_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "phases": {phase: values["seconds"] for phase, values in summary["phases"].items()},
+        "limiter": get_rate_limiter(config).snapshot() if get_rate_limiter(config) is not None else None,
+        "report": summary,
+    }
+
+def run_scenario_subprocess(cedula_count, config):
+    command = [sys.executable, "-m", "bench.run_bench", "--worker", str(cedula_count), "--config-json", json.dumps(config)]
+    if logging.getLogger().isEnabledFor(logging.WARNING): command.append("--verbose")
+    completed = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+    if completed.returncode != 0: raise SystemExit(f"El escenario de {cedula_count} cédula(s) terminó con código {completed.returncode}.")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def format_table(results):
+    header = ("Cédulas", "Elementos", "Errores", "Reintentos", "Segundos", "Elem/s", "MB desc.", "MB/s", "ZIP MB", "RSS MB", "RSS PDF MB", "Fase 1 s", "Fase 2 s")
+    rows = [header] + [(
+        str(result["cedulas"]), str(result["items"]), str(result["errors"]), str(result["retries"]), f"{result['wall_seconds']:.2f}",
+        f"{result['items_per_second']:.1f}", f"{result['downloaded_mb']:.1f}", f"{result['mb_per_second']:.2f}",
+        f"{result['zip_mb']:.1f}", f"{result['peak_rss_mb']:.0f}", f"{result['peak_rss_pdf_workers_mb']:.0f}",
+        f"{result['phases'].get('fase1', 0):.2f}", f"{result['phases'].get('fase2', 0):.2f}",
+    ) for result in results]
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.run_bench", description="Benchmark del motor de exportación contra un CRM simulado.")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS, help="Cantidades de cédulas separadas por comas (por defecto %(default)s)")
+    for key, default in DEFAULT_MOCK_SETTINGS.items():
+        if isinstance(default, bool): parser.add_argument(f"--{key.replace('_', '-')}", dest=key, action="store_true", help="CRM simulado")
+        else: parser.add_argument(f"--{key.replace('_', '-')}", dest=key, type=type(default), default=default, help=f"CRM simulado (por defecto {default})")
+    parser.add_argument("--set", action="append", metavar="CLAVE=VALOR", help="Parámetro del entorno (como en secrets.toml), p.ej. phase2_workers=16")
+    parser.add_argument("--json", help="Guardar los resultados completos (incluye el reporte de métricas) en este archivo")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Mostrar también las advertencias del motor")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--config-json", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING if args.verbose else logging.ERROR, format="%(levelname)s %(message)s", stream=sys.stderr)
+
+    if args.worker is not None:
+        # Proceso hijo: un escenario, resultado como JSON en la última línea de stdout
+        print(json.dumps(run_scenario(args.worker, json.loads(args.config_json)), ensure_ascii=False)); return 0
+
+    scenarios = [int(value) for value in args.scenarios.split(",") if value.strip()]
+    mock_settings = {key: getattr(args, key) for key in DEFAULT_MOCK_SETTINGS}
+    results = []
+    with MockCRM(mock_settings) as crm, tempfile.TemporaryDirectory(prefix="sugos_bench_") as cache_dir:
+        config = bench_config(crm.base_url, cache_dir, parse_overrides(args.set))
+        print(f"CRM simulado en {crm.base_url} ({', '.join(f'{key}={value}' for key, value in mock_settings.items())})", file=sys.stderr)
+        for cedula_count in scenarios:
+            started = time.time(); result = run_scenario_subprocess(cedula_count, config); results.append(result)
+            print(f"  {cedula_count} cédula(s): {result['items']} elementos en {time.time() - started:.1f} s", file=sys.stderr)
+        server_counters = dict(crm.counters)
+    print(format_table(results))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump({"mock_settings": mock_settings, "config": {key: value for key, value in config.items() if key != "cache_dir"},
+                       "server_counters": server_counters, "results": results}, output, indent=2, ensure_ascii=False)
+    return 1 if any(result["errors"] for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
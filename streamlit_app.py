@@ -1,149 +1,32 @@
 import streamlit as st
-import requests
 import os
-import zipfile
-import io
-from urllib.parse import urljoin, urlparse, urlencode
-import re
 import datetime
-from xhtml2pdf import pisa
-from bs4 import BeautifulSoup
+import threading
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from sugos import auth, jobs, report
+from sugos.archive import is_safe_path_component
+from sugos.crm import get_api_token, forget_cached_session
+from sugos.jobs import JobQueueFull
+from sugos.settings import get_cache_dir, get_config_number
 
 # --- Configuración API ---
-# (Sin cambios)
-
-# --- Funciones de Ayuda ---
-# ... (Todas las funciones auxiliares sin cambios: get_api_token, get_orders_for_cedula,
-#      get_order_details_and_attachments, sanitize_filename, download_file_to_zip,
-#      process_link_item) ...
-def get_api_token(api_username, api_password, config):
-    api_base_url = config.get('api_base_url');
-    if not api_base_url: st.error("Error: 'api_base_url' no definida en config."); return None
-    login_url = urljoin(api_base_url, "custom/apps/api.php?login")
-    payload = {"username": api_username, "password": api_password}; headers = {'Content-Type': 'application/json'}
-    try:
-        response = requests.post(login_url, json=payload, headers=headers, timeout=30); response.raise_for_status(); data = response.json()
-        token = data.get("token") or data.get("access_token") or data.get("data", {}).get("token")
-        if not token: st.error(f"Login fallido: No se pudo encontrar token."); return None
-        st.success(f"Autenticación exitosa para {config.get('display_name', 'entorno')}.")
-        return token
-    except requests.exceptions.HTTPError as e:
-        st.error(f"Error HTTP {e.response.status_code} en {login_url}.");
-        if e.response.status_code == 401: st.error("Credenciales inválidas o no autorizadas.")
-        else:
-            try: st.error(f"Respuesta del servidor: {e.response.text}")
-            except Exception: st.error("No se pudo obtener detalle de la respuesta.")
-        return None
-    except requests.exceptions.RequestException as e: st.error(f"Error de conexión durante autenticación a {login_url}: {e}"); return None
-    except Exception as e: st.error(f"Error inesperado procesando login: {e}"); return None
-
-def get_orders_for_cedula(token, cedula, config):
-    api_base_url = config.get('api_base_url'); app_cfn_value = config.get('app_cfn')
-    if not api_base_url or not app_cfn_value: st.error("Configuración inválida (falta api_base_url o app_cfn)."); return []
-    consulta_url = urljoin(api_base_url, "custom/apps/api.php"); action_params = {"afn": "ordermanager", "cfn": app_cfn_value}
-    target_url = f"{consulta_url}?{urlencode(action_params)}"
-    payload = {"page-id": "existing-orders-page", "section-id": "existing-orders", "order-keyword": str(cedula).strip()}
-    headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
-    try:
-        response = requests.get(target_url, headers=headers, json=payload, timeout=60); response.raise_for_status(); data = response.json()
-        if (data.get("status") == "OK" and "data" in data and "existing-orders" in data["data"]):
-            records = data["data"]["existing-orders"].get("Records", []);
-            if not records: return []
-            return [{"id": rec.get("ID"), "tipo_servicio": rec.get("Carrier")} for rec in records if isinstance(rec, dict) and rec.get("ID")]
-        else: return []
-    except requests.exceptions.RequestException as e: st.error(f"[get_orders] Error HTTP GET para {cedula}: {e}"); return []
-    except Exception as e: st.error(f"[get_orders] Error inesperado procesando {cedula}: {e}"); return []
-
-def get_order_details_and_attachments(token, order_id, config):
-    api_base_url = config.get('api_base_url'); download_base_url = config.get('download_base_url', api_base_url)
-    app_cfn_value = config.get('app_cfn')
-    if not api_base_url or not app_cfn_value: st.error("Configuración inválida (falta api_base_url o app_cfn)."); return [], []
-    consulta_url = urljoin(api_base_url, "custom/apps/api.php"); action_params = {"afn": "ordermanager", "cfn": app_cfn_value}
-    target_url = f"{consulta_url}?{urlencode(action_params)}"
-    payload = {"page-id": "existing-orders-page", "section-id": "existing-orders", "order-id": str(order_id)}
-    headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
-    attachments_info = []; links_info = []
-    try:
-        response = requests.get(target_url, headers=headers, json=payload, timeout=60); response.raise_for_status(); data = response.json()
-        if data.get("status") == "OK" and "data" in data:
-            order_details = data.get("data", {}).get("existing-orders", {})
-            if not order_details or not isinstance(order_details, dict): return [], []
-            # Anexos
-            attachments_list = order_details.get("Attachments")
-            if attachments_list and isinstance(attachments_list, list):
-                for att in attachments_list:
-                    if isinstance(att, dict):
-                        f_id=att.get("ID"); f_name=att.get("FileName"); f_path=att.get("FolderPath")
-                        if f_id and f_name and f_path:
-                            f_url_name = f"{f_id}_{f_name}"; rel_path = f"{f_path.strip('/')}/{f_url_name}"
-                            dl_url = urljoin(download_base_url, rel_path)
-                            attachments_info.append({"type": "attachment", "id": f_id, "file_name": f_name, "download_url": dl_url})
-            # Links
-            links_list = order_details.get("Links")
-            if links_list and isinstance(links_list, list):
-                 for link in links_list:
-                     if isinstance(link, dict):
-                         l_name = link.get("Name"); rel_url = link.get("URL")
-                         if l_name and rel_url:
-                             abs_url = urljoin(api_base_url, rel_url.lstrip('/'))
-                             links_info.append({"type": "link", "name": l_name, "url": abs_url, "order_id": order_id})
-        return attachments_info, links_info
-    except requests.exceptions.RequestException as e: st.error(f"[get_details] Error HTTP GET orden {order_id}: {e}"); return [], []
-    except Exception as e: st.error(f"[get_details] Error inesperado procesando orden {order_id}: {e}"); return [], []
-
-def sanitize_filename(filename):
-    sanitized = re.sub(r'[\\/*?:"<>|]', "", filename); sanitized = re.sub(r'\s+', ' ', sanitized).strip(); return sanitized[:100]
-
-def download_file_to_zip(token, download_url, zip_file_handle, zip_path):
-    headers = {'Authorization': f'Bearer {token}'}
-    try:
-        response = requests.get(download_url, headers=headers, stream=True, timeout=180); response.raise_for_status()
-        zip_file_handle.writestr(zip_path, response.content); return True
-    except requests.exceptions.RequestException as e: st.error(f"Error descargando anexo {os.path.basename(zip_path)}: {e}"); return False
-    except Exception as e: st.error(f"Error añadiendo anexo {os.path.basename(zip_path)} al zip: {e}"); return False
-
-def process_link_item(token, link_info, zip_file_handle, base_zip_path, config):
-    link_url = link_info["url"]; link_name = link_info["name"]
-    api_base_url = config.get('api_base_url')
-    if not api_base_url: st.error("Config inválida: falta api_base_url."); return False
-    headers = {'Authorization': f'Bearer {token}'}
-    try:
-        response = requests.get(link_url, headers=headers, timeout=120); response.raise_for_status()
-        content_type = response.headers.get('Content-Type', '').lower()
-        # PDF Directo
-        if 'application/pdf' in content_type:
-            pdf_zip_path = base_zip_path + ".pdf"; zip_file_handle.writestr(pdf_zip_path, response.content); return True
-        # HTML
-        elif 'text/html' in content_type:
-            html_content = response.content; soup = BeautifulSoup(html_content, 'html.parser'); iframe = soup.find('iframe')
-            if iframe and iframe.get('src'): # Iframe encontrado
-                iframe_src = iframe['src']; iframe_url = urljoin(api_base_url, iframe_src)
-                try:
-                    iframe_response = requests.get(iframe_url, headers=headers, timeout=120); iframe_response.raise_for_status()
-                    iframe_content = iframe_response.content; pdf_buffer = io.BytesIO()
-                    content_bytes = iframe_content if isinstance(iframe_content, bytes) else iframe_content.encode('utf-8')
-                    pisa_status = pisa.CreatePDF(io.BytesIO(content_bytes), dest=pdf_buffer, encoding='utf-8')
-                    if pisa_status.err:
-                        st.error(f"Error convirtiendo iframe '{link_name}': {pisa_status.err}")
-                        fb_path = base_zip_path + "_iframe.html"; st.warning(f"Guardando iframe HTML: {fb_path}")
-                        zip_file_handle.writestr(fb_path, content_bytes); return False
-                    pdf_buffer.seek(0); pdf_zip_path = base_zip_path + ".pdf"; zip_file_handle.writestr(pdf_zip_path, pdf_buffer.read()); return True
-                except requests.exceptions.RequestException as e_iframe: st.error(f"Error descargando iframe '{link_name}': {e_iframe}"); return False
-                except Exception as e_conv: st.error(f"Error procesando iframe '{link_name}': {e_conv}"); return False
-            else: # Fallback HTML Principal
-                st.warning(f"No iframe en '{link_name}'. Convirtiendo HTML principal.")
-                pdf_buffer = io.BytesIO(); content_bytes = html_content if isinstance(html_content, bytes) else html_content.encode('utf-8')
-                pisa_status = pisa.CreatePDF(io.BytesIO(content_bytes), dest=pdf_buffer, encoding='utf-8')
-                if pisa_status.err:
-                    st.error(f"Error convirtiendo HTML principal '{link_name}': {pisa_status.err}")
-                    fb_path = base_zip_path + "_main.html"; st.warning(f"Guardando HTML principal: {fb_path}")
-                    zip_file_handle.writestr(fb_path, content_bytes); return False
-                pdf_buffer.seek(0); pdf_zip_path = base_zip_path + ".pdf"; zip_file_handle.writestr(pdf_zip_path, pdf_buffer.read()); return True
-        else: # Tipo Desconocido
-            st.warning(f"Tipo desconocido '{content_type}' para '{link_name}'. Guardando binario.")
-            fallback_zip_path = base_zip_path + ".bin"; zip_file_handle.writestr(fallback_zip_path, response.content); return True
-    except requests.exceptions.RequestException as e: st.error(f"Error procesando link '{link_name}': {e}"); return False
-    except Exception as e: st.error(f"Error inesperado procesando link '{link_name}': {e}"); return False
+# Parámetros por entorno en secrets.toml (ver README); el motor de exportación vive en sugos/.
+
+# --- Mensajes del Motor ---
+class StreamlitReporter:
+    """Muestra los mensajes del motor con st.*; los hilos de sus pools heredan el contexto del script."""
+    def __init__(self):
+        self.ctx = get_script_run_ctx()
+
+    def attach_thread(self):
+        if self.ctx is not None: add_script_run_ctx(threading.current_thread(), self.ctx)
+
+    def error(self, message): st.error(message)
+    def warning(self, message): st.warning(message)
+    def success(self, message): st.success(message)
+    def info(self, message): st.info(message)
+
+report.install(StreamlitReporter())
 
 # --- Interfaz de Streamlit ---
 
@@ -198,6 +81,37 @@ input_api_password = st.sidebar.text_input(
     "Contraseña API", value=default_pass, type="password", key="api_pass"
 )
 st.sidebar.caption("Credenciales para el entorno seleccionado.")
+st.sidebar.button(
+    "🔄 Refrescar datos del CRM", key="refresh_cache_button",
+    on_click=lambda: forget_cached_session(selected_config, st.session_state.api_user),
+    help="Descarta el token y los listados de órdenes guardados para este entorno y usuario.",
+)
+
+# --- Cola de Exportaciones (compartida por todas las sesiones del servidor) ---
+job_manager = jobs.get_job_manager(
+    get_cache_dir(selected_config),
+    workers=get_config_number(selected_config, 'job_workers', jobs.DEFAULT_JOB_WORKERS, minimum=1),
+    queue_max=get_config_number(selected_config, 'job_queue_max', jobs.DEFAULT_JOB_QUEUE_MAX, minimum=1),
+    queue_max_per_user=get_config_number(selected_config, 'job_queue_max_per_user', jobs.DEFAULT_JOB_QUEUE_MAX_PER_USER, minimum=1),
+    result_ttl_hours=get_config_number(selected_config, 'job_result_ttl_hours', jobs.DEFAULT_JOB_RESULT_TTL_HOURS, cast=float),
+)
+# Las exportaciones se agrupan por entorno + usuario API (turnos de la cola y sección "Mis exportaciones").
+# Solo cuenta un usuario autenticado con su contraseña en esta sesión, nunca el texto del campo "Usuario API".
+if 'verified_job_owners' not in st.session_state:
+    st.session_state.verified_job_owners = {}
+
+def remember_job_owner(api_username):
+    api_base_url = selected_config.get('api_base_url')
+    st.session_state.verified_job_owners[api_base_url] = auth.make_scope(api_base_url, api_username)
+    return st.session_state.verified_job_owners[api_base_url]
+
+job_owner = st.session_state.verified_job_owners.get(selected_config.get('api_base_url'))
+if job_owner is None and st.sidebar.button("📂 Ver mis exportaciones", key="show_jobs_button",
+                                           help="Autentica con las credenciales ingresadas para ver sus exportaciones."):
+    if not st.session_state.api_user or not st.session_state.api_pass: st.sidebar.warning("⚠️ Ingrese Usuario y Contraseña API.")
+    elif get_api_token(st.session_state.api_user, st.session_state.api_pass, selected_config):
+        job_owner = remember_job_owner(st.session_state.api_user)
+    st.session_state.clear_password_input = True
 
 
 # --- Entrada de Cédulas ---
@@ -243,6 +157,9 @@ if process_button_pressed:
     st.session_state.clear_password_input = True
 
     initial_cedulas_list = [c.strip() for c in cedulas_current_value.split(',') if c.strip()]
+    invalid_cedulas = [c for c in initial_cedulas_list if not is_safe_path_component(c)]
+    if invalid_cedulas: st.warning(f"⚠️ Se descartaron cédulas inválidas: {', '.join(invalid_cedulas)}")
+    initial_cedulas_list = [c for c in initial_cedulas_list if is_safe_path_component(c)]
     if not initial_cedulas_list: st.warning("⚠️ No cédulas válidas tras procesar entrada."); st.stop()
     unique_cedulas = list(dict.fromkeys(initial_cedulas_list))
     if len(initial_cedulas_list) > len(unique_cedulas):
@@ -250,104 +167,114 @@ if process_button_pressed:
         st.info(f"ℹ️ Nota: Se eliminaron {duplicates_removed} cédulas duplicadas.")
 
     st.info(f"Iniciando para {len(unique_cedulas)} cédula(s) única(s): {', '.join(unique_cedulas)}")
-    items_to_process = []; original_links_display = {}; file_sequence = {ced: 0 for ced in unique_cedulas}
 
     # Autenticar usando los valores actuales del estado
     with st.spinner("Autenticando..."):
         token = get_api_token(current_api_user, current_api_pass, selected_config)
 
     if token:
-        # --- 1. Recopilación ---
-        # ... (sin cambios) ...
-        progress_bar_cedulas = st.progress(0); status_text = st.empty(); status_text.info("Fase 1: Recopilando info...")
-        total_unique_cedulas = len(unique_cedulas)
-        for i, cedula in enumerate(unique_cedulas):
-            current_step_text = f"Cédula: {cedula} ({i+1}/{total_unique_cedulas})"
-            status_text.info(f"{current_step_text} - Buscando órdenes...")
-            original_links_display[cedula] = []
-            orders = get_orders_for_cedula(token, cedula, selected_config)
-            if orders:
-                for order_idx, order in enumerate(orders):
-                    order_id = order.get("id");
-                    if not order_id: continue
-                    status_text.info(f"{current_step_text} - Info Orden ID: {order_id} ({order_idx+1}/{len(orders)})...")
-                    attachments, links = get_order_details_and_attachments(token, order_id, selected_config)
-                    for att in attachments: att["cedula"] = cedula; items_to_process.append(att)
-                    if links:
-                        original_links_display[cedula].append({"order_id": order_id, "links": links})
-                        for link in links: link["cedula"] = cedula; items_to_process.append(link)
-            progress_bar_cedulas.progress((i + 1) / total_unique_cedulas)
-        status_text.info("Fase 1: Recopilación completada."); progress_bar_cedulas.progress(1.0)
-
-        # --- 2. Procesamiento ---
-        if items_to_process:
-            # ... (sin cambios en la lógica de procesamiento) ...
-            total_items = len(items_to_process); st.info(f"Fase 2: Procesando {total_items} elementos...")
-            zip_buffer = io.BytesIO(); processed_count = 0; error_count = 0
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                download_progress = st.progress(0)
-                for idx, item in enumerate(items_to_process):
-                    cedula_item = item["cedula"]; item_type = item["type"]; success = False
-                    status_prefix = f"Procesando ({idx+1}/{total_items})"
-                    file_sequence[cedula_item] += 1; current_sequence = file_sequence[cedula_item]
-                    zip_folder = cedula_item
-                    if item_type == "attachment":
-                        original_filename = item['file_name']; download_url = item['download_url']
-                        try: file_name, extension = os.path.splitext(original_filename); extension = extension.lower() or ".file"
-                        except Exception: extension = ".file"
-                        zip_path = f"{zip_folder}/{cedula_item}-{current_sequence}{extension}"
-                        success = download_file_to_zip(token, download_url, zipf, zip_path)
-                    elif item_type == "link":
-                        base_zip_path = f"{zip_folder}/{cedula_item}-{current_sequence}"
-                        success = process_link_item(token, item, zipf, base_zip_path, selected_config)
-                    if success: processed_count += 1
-                    else: error_count += 1
-                    download_progress.progress((idx + 1) / total_items)
-            status_text.success("Fase 2: Procesamiento completado."); download_progress.progress(1.0); zip_buffer.seek(0)
-
-            # --- 3. Descarga del ZIP ---
-            if processed_count > 0:
-                 st.success(f"¡Éxito! {processed_count} elementos procesados.")
-                 if error_count > 0: st.warning(f"{error_count} elementos tuvieron errores.")
-                 timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                 env_tag = selected_secret_key.replace("_", "-")
-                 zip_filename = f"sugos_export_{env_tag}_{timestamp}.zip"
-
-                 st.download_button(
-                     label=f"Descargar {processed_count} Archivos (ZIP)",
-                     data=zip_buffer,
-                     file_name=zip_filename,
-                     mime="application/zip"
-                 )
-                 # >>> Establecer flag para limpiar CÉDULAS en próximo rerun <<<
-                 st.session_state.run_processed = True
-            else:
-                st.warning("No se pudo procesar exitosamente ningún elemento.")
-                # No limpiar cédulas si no hubo éxito
-                st.session_state.run_processed = False
-        else:
-            st.info("No se encontró ningún anexo o link para procesar.")
-            # No limpiar cédulas si no hubo nada que procesar
+        # --- 1 y 2. Encolar la exportación (se ejecuta en segundo plano, ver sugos/jobs.py) ---
+        job_owner = remember_job_owner(current_api_user)
+        try:
+            job_manager.submit(job_owner, selected_config, token, unique_cedulas, file_tag=selected_secret_key.replace("_", "-"))
+        except JobQueueFull as e:
+            st.warning(f"⚠️ {e} Intente nuevamente cuando termine alguna.")
+            # No limpiar cédulas si no se pudo encolar
             st.session_state.run_processed = False
-
-        # --- 4. Mostrar Links Originales ---
-        # ... (sin cambios) ...
-        st.subheader("Links Originales Encontrados (referencia):")
-        links_found_flag = False
-        if original_links_display:
-            for ced, order_data_list in original_links_display.items():
-                if any(od["links"] for od in order_data_list):
-                    links_found_flag = True; st.markdown(f"--- \n**Cédula: {ced}**")
-                    for od in order_data_list:
-                          if od["links"]:
-                              st.markdown(f"**Orden: {od['order_id']}**")
-                              for link in od["links"]: st.markdown(f"- [{link['name']}]({link['url']})")
-        if not links_found_flag: st.info("No se encontraron links asociados.")
+        else:
+            st.success("Exportación encolada. Puede seguir usando la app o recargar la página: el avance se muestra abajo.")
+            # >>> Establecer flag para limpiar CÉDULAS en próximo rerun <<<
+            st.session_state.run_processed = True
     # else: # Fallo de token manejado
     # >>> ESTABLECER FLAG PARA LIMPIAR CONTRASEÑA en próximo rerun (siempre después del intento) <<<
-        # Esto se ejecuta incluso si el token falla
-        st.session_state.clear_password_input = True
+    # Esto se ejecuta incluso si el token falla
+    st.session_state.clear_password_input = True
 
+# --- 3, 4 y 5. Exportaciones del Usuario (resultado, links y rendimiento) ---
+def render_original_links(original_links_display):
+    st.markdown("**Links Originales Encontrados (referencia):**")
+    links_found_flag = False
+    if original_links_display:
+        for ced, order_data_list in original_links_display.items():
+            if any(od["links"] for od in order_data_list):
+                links_found_flag = True; st.markdown(f"--- \n**Cédula: {ced}**")
+                for od in order_data_list:
+                      if od["links"]:
+                          st.markdown(f"**Orden: {od['order_id']}**")
+                          for link in od["links"]: st.markdown(f"- [{link['name']}]({link['url']})")
+    if not links_found_flag: st.info("No se encontraron links asociados.")
+
+def render_performance(performance):
+    items_summary = performance.get("items", {})
+    st.caption(f"Tiempo total: {performance['wall_seconds']:.1f} s - {items_summary.get('items_per_second', 0):.2f} elementos/s")
+    st.table([{"Fase": phase, "Segundos": values["seconds"], "MB": round(values["bytes"] / (1024 * 1024), 2),
+               "MB/s": values["throughput_mb_s"]} for phase, values in performance["phases"].items()])
+    st.table([{"Tipo": kind, "Fase": values["phase"], "Peticiones": values["count"], "Errores": values["errors"],
+               "Reintentos": values["retries"], "MB": round(values["bytes"] / (1024 * 1024), 2),
+               **{f"{name} (ms)": value for name, value in values["latency_ms"].items()}}
+              for kind, values in performance["requests"].items()])
+    if performance["counters"]: st.caption(", ".join(f"{name}: {value}" for name, value in performance["counters"].items()))
+
+def render_job(job):
+    state = job.state; status = state["status"]; progress = state["progress"]
+    created = datetime.datetime.fromtimestamp(state["created"]).strftime("%Y-%m-%d %H:%M")
+    st.markdown(f"**{state['environment']}** - {len(state['cedulas'])} cédula(s) - {created}")
+    st.caption(", ".join(state["cedulas"][:20]) + (" …" if len(state["cedulas"]) > 20 else ""))
+    if status == jobs.QUEUED:
+        st.info(f"En cola (posición {job_manager.queue_position(job)}).")
+    elif status == jobs.RUNNING:
+        st.progress(progress["cedulas_done"] / max(1, progress["cedulas_total"]),
+                    text=f"Fase 1: Cédulas listas {progress['cedulas_done']}/{progress['cedulas_total']}")
+        st.progress(progress["items_done"] / max(1, progress["items_total"]),
+                    text=f"Fase 2: Elementos {progress['items_done']}/{progress['items_total']}")
+    elif status == jobs.DONE:
+        if not state["total_items"]: st.info("No se encontró ningún anexo o link para procesar.")
+        elif state["processed"] > 0:
+            st.success(f"¡Éxito! {state['processed']} elementos procesados.")
+            if state["errors"] > 0: st.warning(f"{state['errors']} elementos tuvieron errores.")
+            zip_parts = job.part_paths()
+            if len(zip_parts) > 1: st.info(f"La exportación se dividió en {len(zip_parts)} partes.")
+            # Entrega diferida: cada ZIP se lee del disco solo cuando se pulsa el botón (entero en memoria: de ahí la división por defecto)
+            for part_number, zip_path in enumerate(zip_parts, start=1):
+                def read_export_archive(path=zip_path):
+                    with open(path, "rb") as archive: return archive.read()
+                st.download_button(
+                    label=f"Descargar {state['processed']} Archivos (ZIP)" if len(zip_parts) == 1 else f"Descargar parte {part_number}/{len(zip_parts)} (ZIP)",
+                    data=read_export_archive, file_name=os.path.basename(zip_path),
+                    mime="application/zip", key=f"download_{job.id}_{part_number}"
+                )
+        else: st.warning("No se pudo procesar exitosamente ningún elemento.")
+    elif status == jobs.CANCELLED: st.info("Exportación cancelada.")
+    else: st.error("La exportación falló.")
+
+    if status in jobs.FINISHED_STATES:
+        if state["links"]:
+            with st.expander("Links originales"): render_original_links(state["links"])
+        if state["performance"]:
+            with st.expander("Rendimiento de la exportación"): render_performance(state["performance"])
+    problems = [message for message in state["messages"] if message["level"] in ("error", "warning")]
+    if problems:
+        with st.expander(f"Mensajes ({len(problems)})"):
+            for message in problems: (st.error if message["level"] == "error" else st.warning)(message["message"])
+    if status in jobs.FINISHED_STATES:
+        st.button("Eliminar", key=f"remove_{job.id}", on_click=job_manager.remove, args=(job.id, job_owner))
+    else:
+        st.button("Cancelar", key=f"cancel_{job.id}", on_click=job_manager.cancel, args=(job.id, job_owner))
+
+owner_jobs = job_manager.jobs_for(job_owner) if job_owner is not None else []
+if owner_jobs:
+    # Mientras haya exportaciones activas, solo esta sección se vuelve a dibujar periódicamente
+    poll_seconds = get_config_number(selected_config, 'job_poll_seconds', jobs.DEFAULT_JOB_POLL_SECONDS, cast=float, minimum=0.5)
+    active = any(job.state["status"] not in jobs.FINISHED_STATES for job in owner_jobs)
+    @st.fragment(run_every=poll_seconds if active else None)
+    def render_owner_jobs():
+        st.subheader("Mis exportaciones")
+        current_jobs = job_manager.jobs_for(job_owner)
+        for job in current_jobs:
+            with st.container(border=True): render_job(job)
+        # Al terminar la última activa, un rerun completo detiene el sondeo
+        if active and all(job.state["status"] in jobs.FINISHED_STATES for job in current_jobs): st.rerun()
+    render_owner_jobs()
 
 # --- Pie de página ---
 st.markdown("---")
@@ -0,0 +1,2 @@
+# Módulos de soporte del SUGOS Downloader importables fuera del script de Streamlit
+# (pools de procesos, cachés y servicios compartidos entre reruns).
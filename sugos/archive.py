@@ -0,0 +1,177 @@
+# --- Archivo ZIP en Streaming ---
+# Escritura por bloques del ZIP de exportación (o de un árbol de directorios equivalente) y
+# preparación de entradas fuera del ZIP para que un único hilo lo escriba.
+import os
+import re
+import time
+import shutil
+import zipfile
+import tempfile
+import contextlib
+
+from sugos.settings import get_config_number
+
+# Tamaño de bloque de copia y umbral a partir del cual el archivo temporal pasa a disco
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DEFAULT_ZIP_SPOOL_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_STAGING_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+# Compresión por entrada: los formatos ya comprimidos se guardan sin recomprimir (ZIP_STORED)
+DEFAULT_ZIP_DEFLATE_LEVEL = 6
+STORED_EXTENSIONS = frozenset({
+    ".pdf", ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".zip", ".rar", ".7z", ".gz", ".tgz",
+    ".bz2", ".xz", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".mp3", ".mp4", ".m4a", ".mov", ".avi",
+})
+# Firmas de contenido para entradas sin extensión fiable (.file / .bin)
+STORED_MAGIC_PREFIXES = (b"%PDF", b"\xff\xd8\xff", b"\x89PNG", b"GIF8", b"PK\x03\x04", b"Rar!", b"7z\xbc\xaf", b"\x1f\x8b", b"BZh", b"\xfd7zXZ")
+# Tamaño máximo por parte al dividir exportaciones grandes ('zip_split_max_mb'; 0 = un solo ZIP)
+DEFAULT_ZIP_SPLIT_MAX_MB = 0
+# En la app cada parte se lee entera en memoria al pulsar su botón de descarga: se divide por defecto
+DEFAULT_UI_ZIP_SPLIT_MAX_MB = 500
+
+def open_export_archive(config):
+    # El ZIP se escribe sobre un archivo temporal que se vuelca a disco al superar el umbral
+    spool_max = get_config_number(config, 'zip_spool_max_bytes', DEFAULT_ZIP_SPOOL_MAX_BYTES)
+    return tempfile.SpooledTemporaryFile(max_size=spool_max, mode='w+b', suffix=".zip")
+
+def choose_compression(zip_path, content_head=b"", stored_extensions=STORED_EXTENSIONS):
+    if os.path.splitext(zip_path)[1].lower() in stored_extensions: return zipfile.ZIP_STORED
+    if content_head and content_head.startswith(STORED_MAGIC_PREFIXES): return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+def copy_response_to_zip(response, zip_file_handle, zip_path, tee=None):
+    # Copia bloque a bloque la respuesta a la entrada del ZIP (sin cargarla completa en memoria)
+    # y, opcionalmente, a un segundo destino (p.ej. la caché de anexos)
+    with zip_file_handle.open(zip_path, 'w', force_zip64=True) as zip_entry:
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            if chunk:
+                zip_entry.write(chunk)
+                if tee is not None: tee.write(chunk)
+
+def copy_file_to_zip(source, zip_file_handle, zip_path):
+    with zip_file_handle.open(zip_path, 'w', force_zip64=True) as zip_entry:
+        shutil.copyfileobj(source, zip_entry, DOWNLOAD_CHUNK_SIZE)
+
+def sanitize_filename(filename):
+    sanitized = re.sub(r'[\\/*?:"<>|]', "", filename); sanitized = re.sub(r'\s+', ' ', sanitized).strip(); return sanitized[:100]
+
+def is_safe_path_component(name):
+    # Las cédulas se usan como carpeta en el ZIP y en disco: sin separadores ni '.'/'..'
+    return bool(name) and name == sanitize_filename(name) and set(name) != {"."}
+
+class StagedZipEntries:
+    """Entradas de un elemento preparadas fuera del ZIP.
+
+    Imita la parte de `zipfile.ZipFile` que usan los helpers (`writestr` y
+    `open(..., 'w')`) para que los hilos de descarga escriban en archivos
+    temporales; el único hilo escritor las vuelca después con `commit`.
+    """
+    def __init__(self, spool_max):
+        self.spool_max = spool_max; self.entries = []
+
+    def _new_entry(self, zip_path):
+        staged = tempfile.SpooledTemporaryFile(max_size=self.spool_max, mode='w+b'); self.entries.append((zip_path, staged))
+        return staged
+
+    def writestr(self, zip_path, data):
+        self._new_entry(zip_path).write(data if isinstance(data, bytes) else data.encode('utf-8'))
+
+    @contextlib.contextmanager
+    def open(self, zip_path, mode='w', force_zip64=False):
+        staged = self._new_entry(zip_path)
+        try: yield staged
+        except BaseException:
+            # Descarga interrumpida: no dejar una entrada truncada
+            self.entries.remove((zip_path, staged)); staged.close(); raise
+
+    def commit(self, zip_file_handle):
+        # Devuelve las rutas escritas; los primeros bytes permiten elegir la compresión por contenido
+        zip_paths = []
+        for zip_path, staged in self.entries:
+            staged.seek(0); content_head = staged.read(16); staged.seek(0)
+            with zip_file_handle.open(zip_path, 'w', force_zip64=True, content_head=content_head) as zip_entry:
+                shutil.copyfileobj(staged, zip_entry, DOWNLOAD_CHUNK_SIZE)
+            zip_paths.append(zip_path)
+        self.discard(); return zip_paths
+
+    def discard(self):
+        for _, staged in self.entries: staged.close()
+        self.entries = []
+
+class DirectoryArchive:
+    """Destino alternativo al ZIP: escribe cada entrada como archivo bajo `root`.
+
+    Ofrece el `open(ruta, 'w')` de `zipfile.ZipFile` que usa el escritor del pipeline;
+    cada archivo se escribe con un nombre temporal y se renombra al terminar, así una
+    ejecución interrumpida nunca deja archivos a medias.
+    """
+    def __init__(self, root):
+        self.root = root; os.makedirs(root, exist_ok=True)
+
+    def path_for(self, zip_path):
+        # Nunca fuera de `root`, aunque la ruta traiga '..' o sea absoluta
+        root = os.path.realpath(self.root); final_path = os.path.realpath(os.path.join(root, *zip_path.split('/')))
+        if os.path.commonpath([root, final_path]) != root: raise ValueError(f"Ruta fuera del directorio de salida: {zip_path}")
+        return final_path
+
+    def writestr(self, zip_path, data):
+        with self.open(zip_path) as entry: entry.write(data if isinstance(data, bytes) else data.encode('utf-8'))
+
+    @contextlib.contextmanager
+    def open(self, zip_path, mode='w', force_zip64=False, content_head=b""):
+        final_path = self.path_for(zip_path); os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(final_path), suffix=".part")
+        try:
+            with os.fdopen(fd, 'wb') as entry: yield entry
+            os.replace(tmp_path, final_path)
+        except BaseException:
+            try: os.remove(tmp_path)
+            except FileNotFoundError: pass
+            raise
+
+class ExportArchive:
+    """ZIP de exportación con compresión por entrada y división opcional en varias partes.
+
+    Ofrece el mismo `open(ruta, 'w')`/`writestr` que `zipfile.ZipFile`. Cada parte se
+    crea con `open_part(numero)` (por defecto un archivo temporal de `open_export_archive`)
+    y se cierra al superar `zip_split_max_mb`; una parte puede pasarse del límite como
+    mucho en una entrada (`default_split_max_mb` si el entorno no la define). `close()`
+    devuelve los objetos archivo de todas las partes.
+    """
+    def __init__(self, config, open_part=None, default_split_max_mb=DEFAULT_ZIP_SPLIT_MAX_MB):
+        self.deflate_level = min(9, get_config_number(config, 'zip_deflate_level', DEFAULT_ZIP_DEFLATE_LEVEL))
+        extensions = config.get('zip_stored_extensions')
+        self.stored_extensions = frozenset(ext.lower() for ext in extensions) if extensions else STORED_EXTENSIONS
+        self.max_part_bytes = int(get_config_number(config, 'zip_split_max_mb', default_split_max_mb, cast=float) * 1024 * 1024)
+        self.open_part = open_part or (lambda number: open_export_archive(config))
+        self.parts = []; self._zip = None
+
+    def _current_zip(self):
+        if self._zip is None:
+            part = self.open_part(len(self.parts) + 1); self.parts.append(part)
+            self._zip = zipfile.ZipFile(part, 'w', zipfile.ZIP_DEFLATED, compresslevel=self.deflate_level, allowZip64=True)
+        return self._zip
+
+    def _close_part(self):
+        if self._zip is not None: self._zip.close(); self._zip = None
+
+    @contextlib.contextmanager
+    def open(self, zip_path, mode='w', force_zip64=False, content_head=b""):
+        zipf = self._current_zip()
+        info = zipfile.ZipInfo(zip_path, date_time=time.localtime(time.time())[:6]); info.external_attr = 0o644 << 16
+        info.compress_type = choose_compression(zip_path, content_head, self.stored_extensions)
+        if info.compress_type == zipfile.ZIP_DEFLATED: info._compresslevel = self.deflate_level
+        with zipf.open(info, 'w', force_zip64=force_zip64) as entry: yield entry
+        if self.max_part_bytes and zipf.fp.tell() >= self.max_part_bytes: self._close_part()
+
+    def writestr(self, zip_path, data):
+        data = data if isinstance(data, bytes) else data.encode('utf-8')
+        with self.open(zip_path, force_zip64=True, content_head=data[:16]) as entry: entry.write(data)
+
+    def close(self):
+        self._close_part(); return self.parts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,101 @@
+# --- Caché Local de Anexos ---
+# Los contenidos se guardan por su SHA-256 (un mismo archivo se almacena una sola vez) y un índice
+# SQLite asocia cada (entorno, ID de anexo, URL) con su contenido, ETag/Last-Modified y último acceso.
+# Al superar el tamaño máximo se expulsan las entradas usadas hace más tiempo (LRU).
+import os
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "sugos_cache")
+DEFAULT_ATTACHMENT_CACHE_MAX_MB = 2048
+
+class BlobWriter:
+    """Archivo temporal que calcula el SHA-256 mientras se escribe; se publica con `AttachmentCache.store`."""
+    def __init__(self, tmp_dir):
+        fd, self.path = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+        self.file = os.fdopen(fd, "wb"); self.digest = hashlib.sha256(); self.size = 0
+
+    def write(self, chunk):
+        self.file.write(chunk); self.digest.update(chunk); self.size += len(chunk)
+
+    def discard(self):
+        if not self.file.closed: self.file.close()
+        try: os.remove(self.path)
+        except FileNotFoundError: pass
+
+class AttachmentCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory; self.max_bytes = max_bytes
+        self.blob_dir = os.path.join(directory, "blobs"); self.tmp_dir = os.path.join(directory, "tmp")
+        os.makedirs(self.blob_dir, exist_ok=True); os.makedirs(self.tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"), timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS blobs (sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, sha256 TEXT NOT NULL, "
+                             "etag TEXT, last_modified TEXT, last_access REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+
+    @staticmethod
+    def make_key(environment, attachment_id, url):
+        return hashlib.sha256(f"{environment}\0{attachment_id}\0{url}".encode("utf-8")).hexdigest()
+
+    def _blob_path(self, sha256):
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def lookup(self, key):
+        """Devuelve (archivo abierto, etag, last_modified) o None. El archivo queda abierto aunque se expulse después."""
+        with self._lock:
+            row = self._db.execute("SELECT sha256, etag, last_modified FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None: return None
+        try: blob = open(self._blob_path(row[0]), "rb")
+        except FileNotFoundError:
+            with self._lock, self._db: self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        return blob, row[1], row[2]
+
+    def touch(self, key):
+        with self._lock, self._db: self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+
+    def new_blob(self):
+        return BlobWriter(self.tmp_dir)
+
+    def store(self, key, writer, etag=None, last_modified=None):
+        writer.file.close(); sha256 = writer.digest.hexdigest(); blob_path = self._blob_path(sha256)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        with self._lock, self._db:
+            if os.path.exists(blob_path): writer.discard()
+            else: os.replace(writer.path, blob_path)
+            self._db.execute("INSERT OR IGNORE INTO blobs (sha256, size) VALUES (?, ?)", (sha256, writer.size))
+            self._db.execute("INSERT OR REPLACE INTO entries (key, sha256, etag, last_modified, last_access) VALUES (?, ?, ?, ?, ?)",
+                             (key, sha256, etag, last_modified, time.time()))
+            self._evict_locked()
+
+    def _evict_locked(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes: return
+        for key, sha256 in self._db.execute("SELECT key, sha256 FROM entries ORDER BY last_access").fetchall():
+            if total <= self.max_bytes: break
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            if self._db.execute("SELECT 1 FROM entries WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone(): continue
+            size = self._db.execute("SELECT size FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+            self._db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+            try: os.remove(self._blob_path(sha256))
+            except FileNotFoundError: pass
+            total -= size[0] if size else 0
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_attachment_cache(directory=DEFAULT_CACHE_DIR, max_mb=DEFAULT_ATTACHMENT_CACHE_MAX_MB):
+    """Caché compartida por proceso para un directorio; None si está desactivada (max_mb <= 0)."""
+    if not max_mb or max_mb <= 0: return None
+    directory = os.path.join(directory, "attachments")
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None: cache = _caches[directory] = AttachmentCache(directory, int(max_mb * 1024 * 1024))
+        else: cache.max_bytes = int(max_mb * 1024 * 1024)
+        return cache
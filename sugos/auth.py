@@ -0,0 +1,56 @@
+# --- Tokens de API Reutilizables ---
+# Un token por (entorno, usuario, contraseña) se reutiliza entre reruns hasta su expiración, y
+# `AuthToken` se renueva automáticamente cuando el CRM responde 401.
+import json
+import time
+import base64
+import hashlib
+import threading
+
+from sugos.ttl_cache import TTLCache
+
+DEFAULT_TOKEN_TTL_SECONDS = 1800
+# Margen para no usar un token a punto de caducar
+TOKEN_EXPIRY_MARGIN_SECONDS = 60
+
+api_tokens = TTLCache(max_entries=1000)
+
+def make_scope(api_base_url, username):
+    # Ámbito de caché: entorno + usuario (los datos visibles dependen de los permisos del usuario)
+    return hashlib.sha256(f"{api_base_url}\0{username}".encode("utf-8")).hexdigest()
+
+def make_token_key(scope, password):
+    return (scope, hashlib.sha256(password.encode("utf-8")).hexdigest())
+
+def _jwt_expiry(token):
+    parts = token.split(".")
+    if len(parts) != 3: return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(parts[1] + "=" * (-len(parts[1]) % 4)))
+        return float(payload["exp"])
+    except (ValueError, KeyError, TypeError): return None
+
+def token_ttl(token, login_data, default_ttl=DEFAULT_TOKEN_TTL_SECONDS):
+    """Segundos de validez: `expires_in` de la respuesta, `exp` del JWT o el valor por defecto."""
+    for source in (login_data, login_data.get("data") if isinstance(login_data.get("data"), dict) else {}):
+        try: return float(source["expires_in"]) - TOKEN_EXPIRY_MARGIN_SECONDS
+        except (KeyError, TypeError, ValueError): pass
+    expiry = _jwt_expiry(token)
+    if expiry is not None: return expiry - time.time() - TOKEN_EXPIRY_MARGIN_SECONDS
+    return default_ttl
+
+class AuthToken:
+    """Token renovable. `str(token)` devuelve el valor vigente, así que sirve donde antes se usaba el str."""
+    def __init__(self, value, scope, login):
+        self.value = value; self.scope = scope; self._login = login; self._lock = threading.Lock()
+
+    def __str__(self):
+        return self.value
+
+    def refresh(self, stale_value):
+        # Varios hilos pueden recibir 401 con el mismo token: solo el primero vuelve a autenticar
+        with self._lock:
+            if self.value == stale_value:
+                new_value = self._login()
+                if new_value: self.value = new_value
+            return self.value != stale_value
@@ -0,0 +1,208 @@
+# --- Exportación por Lotes (sin interfaz) ---
+# Uso:
+#   python -m sugos.batch cedulas.csv --secrets .streamlit/secrets.toml --env produccion \
+#       --output exports/lote1 [--zip exports/lote1.zip]
+#
+# Descarga al directorio de salida (una carpeta por cédula, mismos nombres que el ZIP de la UI) y
+# registra cada elemento terminado en un manifiesto JSONL. Si la ejecución se interrumpe, volver a
+# lanzar el mismo comando retoma desde el manifiesto sin descargar de nuevo lo ya exportado.
+import os
+import re
+import csv
+import sys
+import json
+import logging
+import argparse
+import shutil
+import tomllib
+
+from sugos import metrics, report
+from sugos.archive import DOWNLOAD_CHUNK_SIZE, DirectoryArchive, ExportArchive, is_safe_path_component
+from sugos.crm import get_api_token
+from sugos.export import item_key, run_export_pipeline
+
+MANIFEST_NAME = ".sugos_manifest.jsonl"
+DEFAULT_BATCH_SIZE = 200
+
+logger = logging.getLogger("sugos.batch")
+
+def read_cedulas(path):
+    """Cédulas únicas en orden de aparición. CSV: columna 'cedula' si existe, si no la primera.
+
+    Se descartan (con aviso) los valores que no sirven como nombre de carpeta ('../x', 'a/b').
+    """
+    with open(path, newline='', encoding='utf-8-sig') as source:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.reader(source))
+            if not rows: return []
+            header = [cell.strip().lower() for cell in rows[0]]
+            if "cedula" in header or "cédula" in header:
+                column = header.index("cedula") if "cedula" in header else header.index("cédula"); rows = rows[1:]
+            else: column = 0
+            values = [row[column] for row in rows if len(row) > column]
+        else: values = re.split(r"[\s,;]+", source.read())
+    cedulas = []
+    for cedula in dict.fromkeys(value.strip() for value in values if value.strip()):
+        if is_safe_path_component(cedula): cedulas.append(cedula)
+        else: logger.warning("Cédula inválida descartada: %r", cedula)
+    return cedulas
+
+def load_environment(secrets_path, env_key):
+    with open(secrets_path, "rb") as secrets_file: secrets = tomllib.load(secrets_file)
+    config = secrets.get(env_key)
+    if not isinstance(config, dict) or not config.get('api_base_url'):
+        valid = sorted(key for key, value in secrets.items() if isinstance(value, dict) and value.get('api_base_url'))
+        raise SystemExit(f"Entorno '{env_key}' no encontrado en {secrets_path}. Disponibles: {', '.join(valid) or 'ninguno'}")
+    return config, secrets.get("api_credentials", {})
+
+class Manifest:
+    """Registro JSONL de elementos y cédulas completados; se reescribe solo añadiendo líneas.
+
+    Cada ruta pertenece a un único elemento: si un elemento se exporta en una ruta que otro
+    tenía registrada (la numeración cambió en el CRM), el anterior deja de contar como exportado.
+    """
+    def __init__(self, path):
+        self.path = path; self.items = {}; self.cedulas = set(); self._owners = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as manifest_file:
+                for line in manifest_file:
+                    try: record = json.loads(line)
+                    except ValueError: continue  # Última línea truncada por una interrupción
+                    if "item" in record: self._claim(record["item"], record.get("paths"))
+                    elif "cedula" in record: self.cedulas.add(record["cedula"])
+        self._file = open(path, "a", encoding='utf-8')
+
+    def _append(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n"); self._file.flush()
+
+    def _claim(self, key, paths):
+        # Devuelve los elementos que perdieron alguna de sus rutas; paths=None retira el elemento
+        for path in self.items.pop(key, None) or []:
+            if self._owners.get(path) == key: del self._owners[path]
+        displaced = []
+        for path in paths or []:
+            previous = self._owners.get(path)
+            if previous is not None and previous != key: self._claim(previous, None); displaced.append(previous)
+            self._owners[path] = key
+        if paths is not None: self.items[key] = paths
+        return displaced
+
+    def item_done(self, key, paths):
+        for displaced in self._claim(key, paths): self._append({"item": displaced, "paths": None})
+        self._append({"item": key, "paths": paths})
+
+    def cedula_done(self, cedula):
+        self.cedulas.add(cedula); self._append({"cedula": cedula}); os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+def build_zip_from_directory(root, zip_path, config):
+    """Arma el ZIP final desde disco (sin volver a descargar). Devuelve las rutas de las partes.
+
+    Con 'zip_split_max_mb' se generan `<nombre>_parteN.zip`; cada parte se escribe como
+    `.part` y se renombra al terminar.
+    """
+    part_paths = []
+    def open_part(number):
+        part_paths.append(f"{zip_path}.{number}.part"); return open(part_paths[-1], "w+b")
+    archive = ExportArchive(config, open_part=open_part)
+    try:
+        with archive:
+            for folder, dirs, files in os.walk(root):
+                dirs.sort()
+                for name in sorted(files):
+                    if name == MANIFEST_NAME or name.endswith(".part"): continue
+                    full_path = os.path.join(folder, name); arcname = os.path.relpath(full_path, root).replace(os.sep, "/")
+                    with open(full_path, "rb") as source:
+                        with archive.open(arcname, 'w', force_zip64=True, content_head=source.read(16)) as entry:
+                            source.seek(0); shutil.copyfileobj(source, entry, DOWNLOAD_CHUNK_SIZE)
+    except BaseException:
+        for part in archive.parts: part.close()
+        for tmp_path in part_paths:
+            try: os.remove(tmp_path)
+            except FileNotFoundError: pass
+        raise
+    base, extension = os.path.splitext(zip_path); final_paths = []
+    for number, (part, tmp_path) in enumerate(zip(archive.parts, part_paths), start=1):
+        part.close(); final_path = zip_path if len(part_paths) == 1 else f"{base}_parte{number}{extension or '.zip'}"
+        os.replace(tmp_path, final_path); final_paths.append(final_path)
+    return final_paths
+
+def write_performance_report(run_metrics, output_dir, items):
+    # Queda junto a las carpetas de cédulas, así que también entra en el ZIP final
+    with open(os.path.join(output_dir, metrics.REPORT_FILENAME), "w", encoding="utf-8") as report_file:
+        json.dump(run_metrics.summary(items=items), report_file, indent=2, ensure_ascii=False)
+
+def run_batch(cedulas, config, username, password, output_dir, batch_size=DEFAULT_BATCH_SIZE, manifest_path=None):
+    """Exporta `cedulas` a `output_dir` retomando desde el manifiesto. Devuelve (procesados, errores).
+
+    Al terminar escribe `reporte_rendimiento.json` con las métricas de esta ejecución.
+    """
+    archive = DirectoryArchive(output_dir); manifest = Manifest(manifest_path or os.path.join(output_dir, MANIFEST_NAME))
+    run_metrics = metrics.RunMetrics(); previous_metrics = metrics.current(); metrics.install(run_metrics)
+    try:
+        pending_cedulas = [ced for ced in cedulas if ced not in manifest.cedulas]
+        if len(pending_cedulas) < len(cedulas): logger.info("Retomando: %d cédula(s) ya completadas.", len(cedulas) - len(pending_cedulas))
+        if not pending_cedulas: return 0, 0
+        token = get_api_token(username, password, config)
+        if not token: raise SystemExit("No se pudo autenticar contra el CRM.")
+
+        def already_exported(item, zip_path):
+            # Solo si se exportó con la numeración actual (los links añaden su extensión o sufijo a la ruta)
+            paths = manifest.items.get(item_key(item))
+            return bool(paths) and all((path == zip_path or path.startswith(zip_path) and path[len(zip_path)] in "._")
+                                       and os.path.exists(archive.path_for(path)) for path in paths)
+
+        total_items = 0; total_processed = 0; total_errors = 0
+        for start in range(0, len(pending_cedulas), batch_size):
+            batch = pending_cedulas[start:start + batch_size]
+            logger.info("Lote %d-%d de %d cédula(s) pendientes...", start + 1, start + len(batch), len(pending_cedulas))
+            # Una cédula con errores no se marca completa: se reintentan sus elementos fallidos la próxima vez
+            failed_cedulas = set()
+            def item_finished(item, zip_paths, success):
+                if success: manifest.item_done(item_key(item), zip_paths)
+                else: failed_cedulas.add(item["cedula"])
+            def cedula_finished(cedula):
+                if cedula not in failed_cedulas: manifest.cedula_done(cedula)
+            _, batch_items, processed, errors = run_export_pipeline(
+                token, batch, config, archive, skip_item=already_exported, on_item_done=item_finished,
+                on_cedula_done=cedula_finished, on_cedula_failed=failed_cedulas.add)
+            total_items += batch_items; total_processed += processed; total_errors += errors
+            logger.info("Lote terminado: %d elemento(s), %d con errores.", batch_items, errors)
+        write_performance_report(run_metrics, output_dir, {"total": total_items, "processed": total_processed, "errors": total_errors})
+        return total_processed, total_errors
+    finally: manifest.close(); metrics.install(previous_metrics)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sugos.batch", description="Exportación por lotes de anexos y links del CRM SUGOS.")
+    parser.add_argument("cedulas_file", help="Archivo .csv (columna 'cedula' o primera columna) o .txt con cédulas")
+    parser.add_argument("--secrets", default=os.path.join(".streamlit", "secrets.toml"), help="secrets.toml con los entornos")
+    parser.add_argument("--env", required=True, help="Sección del entorno en secrets.toml")
+    parser.add_argument("--output", required=True, help="Directorio de salida (una carpeta por cédula)")
+    parser.add_argument("--zip", help="Además, empaquetar el resultado en este archivo ZIP al terminar")
+    parser.add_argument("--user", help="Usuario API (por defecto [api_credentials] de secrets.toml)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Cédulas por lote (por defecto %(default)s)")
+    parser.add_argument("--manifest", help=f"Manifiesto de progreso (por defecto <output>/{MANIFEST_NAME})")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    config, credentials = load_environment(args.secrets, args.env)
+    username = args.user or credentials.get("username")
+    # La contraseña nunca por argumento (queda en el historial): variable de entorno o secrets.toml
+    password = os.environ.get("SUGOS_API_PASSWORD") or credentials.get("password")
+    if not username or not password: raise SystemExit("Faltan credenciales: use --user y SUGOS_API_PASSWORD o [api_credentials].")
+    cedulas = read_cedulas(args.cedulas_file)
+    if not cedulas: raise SystemExit(f"No se encontraron cédulas en {args.cedulas_file}.")
+    logger.info("%d cédula(s) única(s) para %s.", len(cedulas), config.get('display_name', args.env))
+
+    with report.using(report.LogReporter()):
+        processed, errors = run_batch(cedulas, config, username, password, args.output, max(1, args.batch_size), args.manifest)
+    logger.info("Exportación terminada: %d elemento(s) procesados, %d con errores.", processed, errors)
+    if args.zip:
+        for zip_part in build_zip_from_directory(args.output, args.zip, config): logger.info("ZIP generado: %s", zip_part)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+# --- Cliente de la API del CRM ---
+# Sesión HTTP compartida, autenticación y consultas de órdenes (custom/apps/api.php).
+import threading
+import contextlib
+import http.cookiejar
+from urllib.parse import urljoin, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from sugos import auth, limiter, metrics, report
+from sugos.settings import get_config_number
+from sugos.ttl_cache import crm_listings
+
+# Sesión HTTP compartida por entorno (claves 'http_*' en secrets.toml)
+DEFAULT_HTTP_POOL_SIZE = 16
+DEFAULT_HTTP_MAX_RETRIES = 3
+DEFAULT_HTTP_BACKOFF_FACTOR = 0.5
+DEFAULT_HTTP_CONNECT_TIMEOUT = 10
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Concurrencia adaptativa por entorno (claves 'adaptive_concurrency' y 'http_*_concurrency', ver sugos/limiter.py)
+DEFAULT_ADAPTIVE_CONCURRENCY = True
+# Memoización de listados de órdenes y detalles entre reruns ('listing_cache_ttl_seconds'; 0 la desactiva)
+DEFAULT_LISTING_CACHE_TTL_SECONDS = 600
+
+# --- Sesión HTTP ---
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def build_http_session(api_base_url, pool_size, max_retries, backoff_factor, rate_limiter=None):
+    # Un pool de conexiones keep-alive por entorno, compartido entre reruns, usuarios y hilos
+    key = (api_base_url, pool_size, max_retries, backoff_factor, id(rate_limiter))
+    with _sessions_lock:
+        if key in _sessions: return _sessions[key]
+    # Cada 429/5xx o error de conexión (incluidos los reintentos internos) se informa al limitador
+    retry = limiter.FeedbackRetry(
+        total=max_retries, connect=max_retries, read=max_retries, status=max_retries,
+        backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset({"GET", "POST"}), respect_retry_after_header=True, raise_on_status=False,
+        limiter=rate_limiter,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session(); session.mount("http://", adapter); session.mount("https://", adapter)
+    # Sin cookies: la sesión la comparten todos los usuarios del entorno y una cookie de login
+    # (p.ej. PHPSESSID de api.php) no debe reenviarse en las peticiones de otro usuario
+    session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    with _sessions_lock: return _sessions.setdefault(key, session)
+
+def get_http_session(config):
+    return build_http_session(
+        config.get('api_base_url', ''),
+        get_config_number(config, 'http_pool_size', DEFAULT_HTTP_POOL_SIZE, minimum=1),
+        get_config_number(config, 'http_max_retries', DEFAULT_HTTP_MAX_RETRIES),
+        get_config_number(config, 'http_backoff_factor', DEFAULT_HTTP_BACKOFF_FACTOR, cast=float),
+        get_rate_limiter(config),
+    )
+
+def get_rate_limiter(config):
+    # None si 'adaptive_concurrency' está desactivado; el máximo por defecto es el tamaño del pool HTTP
+    if not config.get('adaptive_concurrency', DEFAULT_ADAPTIVE_CONCURRENCY): return None
+    pool_size = get_config_number(config, 'http_pool_size', DEFAULT_HTTP_POOL_SIZE, minimum=1)
+    return limiter.get_limiter(
+        config.get('api_base_url', ''),
+        get_config_number(config, 'http_max_concurrency', pool_size, minimum=1),
+        get_config_number(config, 'http_min_concurrency', limiter.DEFAULT_LIMITER_MIN, minimum=1),
+        get_config_number(config, 'http_initial_concurrency', limiter.DEFAULT_LIMITER_INITIAL, minimum=1),
+        get_config_number(config, 'http_latency_tolerance', limiter.DEFAULT_LIMITER_LATENCY_TOLERANCE, cast=float, minimum=1.0),
+        get_config_number(config, 'http_concurrency_backoff', limiter.DEFAULT_LIMITER_BACKOFF_RATIO, cast=float, minimum=0.1),
+    )
+
+def request_slot(config):
+    # Turno del limitador del entorno alrededor de cada petición (sin limitador, no espera)
+    rate_limiter = get_rate_limiter(config)
+    return rate_limiter.slot() if rate_limiter is not None else contextlib.nullcontext()
+
+def http_timeout(config, read_timeout):
+    # (connect, read): fallar rápido al conectar sin cortar descargas largas
+    return (get_config_number(config, 'http_connect_timeout', DEFAULT_HTTP_CONNECT_TIMEOUT, cast=float), read_timeout)
+
+# --- Autenticación y Memoización ---
+def authorized_get(token, url, config, headers=None, **kwargs):
+    # GET con el token vigente; ante un 401 se vuelve a autenticar una vez y se reintenta
+    session = get_http_session(config); stale_value = str(token)
+    headers = dict(headers or {}); headers['Authorization'] = f'Bearer {stale_value}'
+    with request_slot(config): response = session.get(url, headers=headers, **kwargs)
+    # El turno se libera antes de re-autenticar: el login también pasa por el limitador
+    if response.status_code == 401 and hasattr(token, 'refresh') and token.refresh(stale_value):
+        response.close(); headers['Authorization'] = f'Bearer {token}'
+        with request_slot(config): response = session.get(url, headers=headers, **kwargs)
+    return metrics.track(response)
+
+def listing_cache_key(token, config, kind, identifier):
+    # Solo se memoiza con tokens de sesión (ámbito entorno + usuario) y TTL > 0
+    scope = getattr(token, 'scope', None)
+    if scope is None or listing_cache_ttl(config) <= 0: return None
+    return (scope, config.get('app_cfn'), kind, str(identifier))
+
+def listing_cache_ttl(config):
+    return get_config_number(config, 'listing_cache_ttl_seconds', DEFAULT_LISTING_CACHE_TTL_SECONDS, cast=float)
+
+def forget_cached_session(config, api_username):
+    # Botón "Refrescar": descarta token, órdenes y detalles memoizados de este entorno y usuario
+    scope = auth.make_scope(config.get('api_base_url'), api_username)
+    crm_listings.invalidate(scope); auth.api_tokens.invalidate(scope)
+
+# --- Consultas al CRM ---
+def get_api_token(api_username, api_password, config, use_cache=True):
+    api_base_url = config.get('api_base_url');
+    if not api_base_url: report.error("Error: 'api_base_url' no definida en config."); return None
+    scope = auth.make_scope(api_base_url, api_username); token_key = auth.make_token_key(scope, api_password)
+    def relogin():
+        fresh = get_api_token(api_username, api_password, config, use_cache=False); return fresh.value if fresh else None
+    if use_cache:
+        cached_token = auth.api_tokens.get(token_key)
+        if cached_token:
+            report.success(f"Sesión reutilizada para {config.get('display_name', 'entorno')}."); return auth.AuthToken(cached_token, scope, relogin)
+    login_url = urljoin(api_base_url, "custom/apps/api.php?login")
+    payload = {"username": api_username, "password": api_password}; headers = {'Content-Type': 'application/json'}
+    try:
+        with request_slot(config), metrics.measure("login"):
+            response = metrics.track(get_http_session(config).post(login_url, json=payload, headers=headers, timeout=http_timeout(config, 30))); response.raise_for_status(); data = response.json()
+        token = data.get("token") or data.get("access_token") or data.get("data", {}).get("token")
+        if not token: report.error(f"Login fallido: No se pudo encontrar token."); return None
+        default_ttl = get_config_number(config, 'token_ttl_seconds', auth.DEFAULT_TOKEN_TTL_SECONDS)
+        auth.api_tokens.put(token_key, token, auth.token_ttl(token, data, default_ttl))
+        report.success(f"Autenticación exitosa para {config.get('display_name', 'entorno')}.")
+        return auth.AuthToken(token, scope, relogin)
+    except requests.exceptions.HTTPError as e:
+        report.error(f"Error HTTP {e.response.status_code} en {login_url}.");
+        if e.response.status_code == 401: report.error("Credenciales inválidas o no autorizadas.")
+        else:
+            try: report.error(f"Respuesta del servidor: {e.response.text}")
+            except Exception: report.error("No se pudo obtener detalle de la respuesta.")
+        return None
+    except requests.exceptions.RequestException as e: report.error(f"Error de conexión durante autenticación a {login_url}: {e}"); return None
+    except Exception as e: report.error(f"Error inesperado procesando login: {e}"); return None
+
+# Las consultas devuelven None si fallan (error ya informado), distinto de "sin órdenes"/"sin anexos"
+def get_orders_for_cedula(token, cedula, config):
+    api_base_url = config.get('api_base_url'); app_cfn_value = config.get('app_cfn')
+    if not api_base_url or not app_cfn_value: report.error("Configuración inválida (falta api_base_url o app_cfn)."); return None
+    consulta_url = urljoin(api_base_url, "custom/apps/api.php"); action_params = {"afn": "ordermanager", "cfn": app_cfn_value}
+    target_url = f"{consulta_url}?{urlencode(action_params)}"
+    payload = {"page-id": "existing-orders-page", "section-id": "existing-orders", "order-keyword": str(cedula).strip()}
+    headers = {'Content-Type': 'application/json'}
+    cache_key = listing_cache_key(token, config, "orders", str(cedula).strip())
+    cached_orders = crm_listings.get(cache_key) if cache_key else None
+    if cached_orders is not None: return cached_orders
+    try:
+        with metrics.measure("orders"):
+            response = authorized_get(token, target_url, config, headers=headers, json=payload, timeout=http_timeout(config, 60)); response.raise_for_status(); data = response.json()
+        if (data.get("status") == "OK" and "data" in data and "existing-orders" in data["data"]):
+            records = data["data"]["existing-orders"].get("Records", []) or []
+            orders = [{"id": rec.get("ID"), "tipo_servicio": rec.get("Carrier")} for rec in records if isinstance(rec, dict) and rec.get("ID")]
+            if cache_key: crm_listings.put(cache_key, orders, listing_cache_ttl(config))
+            return orders
+        else: return []
+    except requests.exceptions.RequestException as e: report.error(f"[get_orders] Error HTTP GET para {cedula}: {e}"); return None
+    except Exception as e: report.error(f"[get_orders] Error inesperado procesando {cedula}: {e}"); return None
+
+def get_order_details_and_attachments(token, order_id, config):
+    api_base_url = config.get('api_base_url'); download_base_url = config.get('download_base_url', api_base_url)
+    app_cfn_value = config.get('app_cfn')
+    if not api_base_url or not app_cfn_value: report.error("Configuración inválida (falta api_base_url o app_cfn)."); return None
+    consulta_url = urljoin(api_base_url, "custom/apps/api.php"); action_params = {"afn": "ordermanager", "cfn": app_cfn_value}
+    target_url = f"{consulta_url}?{urlencode(action_params)}"
+    payload = {"page-id": "existing-orders-page", "section-id": "existing-orders", "order-id": str(order_id)}
+    headers = {'Content-Type': 'application/json'}
+    cache_key = listing_cache_key(token, config, "details", order_id)
+    cached_details = crm_listings.get(cache_key) if cache_key else None
+    if cached_details is not None: return cached_details
+    attachments_info = []; links_info = []
+    try:
+        with metrics.measure("details"):
+            response = authorized_get(token, target_url, config, headers=headers, json=payload, timeout=http_timeout(config, 60)); response.raise_for_status(); data = response.json()
+        if data.get("status") == "OK" and "data" in data:
+            order_details = data.get("data", {}).get("existing-orders", {})
+            if not order_details or not isinstance(order_details, dict): return [], []
+            # Anexos
+            attachments_list = order_details.get("Attachments")
+            if attachments_list and isinstance(attachments_list, list):
+                for att in attachments_list:
+                    if isinstance(att, dict):
+                        f_id=att.get("ID"); f_name=att.get("FileName"); f_path=att.get("FolderPath")
+                        if f_id and f_name and f_path:
+                            f_url_name = f"{f_id}_{f_name}"; rel_path = f"{f_path.strip('/')}/{f_url_name}"
+                            dl_url = urljoin(download_base_url, rel_path)
+                            attachments_info.append({"type": "attachment", "id": f_id, "file_name": f_name, "download_url": dl_url})
+            # Links
+            links_list = order_details.get("Links")
+            if links_list and isinstance(links_list, list):
+                 for link in links_list:
+                     if isinstance(link, dict):
+                         l_name = link.get("Name"); rel_url = link.get("URL")
+                         if l_name and rel_url:
+                             abs_url = urljoin(api_base_url, rel_url.lstrip('/'))
+                             links_info.append({"type": "link", "name": l_name, "url": abs_url, "order_id": order_id})
+            if cache_key: crm_listings.put(cache_key, (attachments_info, links_info), listing_cache_ttl(config))
+        return attachments_info, links_info
+    except requests.exceptions.RequestException as e: report.error(f"[get_details] Error HTTP GET orden {order_id}: {e}"); return None
+    except Exception as e: report.error(f"[get_details] Error inesperado procesando orden {order_id}: {e}"); return None
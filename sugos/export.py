@@ -0,0 +1,240 @@
+# --- Motor de Exportación Concurrente (Fases 1 y 2 en pipeline) ---
+# Descarga anexos y links de las órdenes de cada cédula hacia un ZIP (o directorio) de destino.
+# No depende de Streamlit: la UI y la CLI por lotes (sugos/batch.py) comparten este código.
+import os
+import time
+from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from bs4 import BeautifulSoup
+
+from sugos import attachment_cache, metrics, pdf_cache, pdf_render, report
+from sugos.archive import (DEFAULT_STAGING_SPOOL_MAX_BYTES, StagedZipEntries, copy_file_to_zip,
+                           copy_response_to_zip)
+from sugos.crm import (authorized_get, get_order_details_and_attachments, get_orders_for_cedula,
+                       http_timeout)
+from sugos.settings import get_cache_dir, get_config_number
+
+# Número de hilos por defecto para la Fase 1 (sobrescribible con 'phase1_workers' en cada entorno de secrets.toml)
+DEFAULT_PHASE1_WORKERS = 8
+# Hilos de descarga de la Fase 2 ('phase2_workers'); un único hilo escribe el ZIP
+DEFAULT_PHASE2_WORKERS = 8
+
+# --- Descarga de Elementos ---
+def get_attachment_cache(config):
+    return attachment_cache.get_attachment_cache(
+        get_cache_dir(config),
+        get_config_number(config, 'attachment_cache_max_mb', attachment_cache.DEFAULT_ATTACHMENT_CACHE_MAX_MB, cast=float),
+    )
+
+def download_file_to_zip(token, download_url, zip_file_handle, zip_path, config, attachment_id=None):
+    headers = {}
+    cache = get_attachment_cache(config); cache_key = None; cached = None
+    if cache is not None:
+        cache_key = cache.make_key(config.get('api_base_url', ''), attachment_id, download_url); cached = cache.lookup(cache_key)
+    try:
+        if cached is None:
+            with authorized_get(token, download_url, config, headers=headers, stream=True, timeout=http_timeout(config, 180)) as response:
+                response.raise_for_status(); store_response_to_zip(response, zip_file_handle, zip_path, cache, cache_key)
+            return True
+        blob, etag, last_modified = cached
+        with blob:
+            # Revalidación condicional; sin validadores el anexo se considera inmutable (su ID lo identifica)
+            if etag: headers['If-None-Match'] = etag
+            if last_modified: headers['If-Modified-Since'] = last_modified
+            if etag or last_modified:
+                with authorized_get(token, download_url, config, headers=headers, stream=True, timeout=http_timeout(config, 180)) as response:
+                    if response.status_code != 304:
+                        response.raise_for_status(); store_response_to_zip(response, zip_file_handle, zip_path, cache, cache_key); return True
+                metrics.count("attachment_revalidated")
+            copy_file_to_zip(blob, zip_file_handle, zip_path); cache.touch(cache_key); metrics.count("attachment_cache_hits")
+        return True
+    except requests.exceptions.RequestException as e: report.error(f"Error descargando anexo {os.path.basename(zip_path)}: {e}"); return False
+    except Exception as e: report.error(f"Error añadiendo anexo {os.path.basename(zip_path)} al zip: {e}"); return False
+
+def store_response_to_zip(response, zip_file_handle, zip_path, cache, cache_key):
+    if cache is None: copy_response_to_zip(response, zip_file_handle, zip_path); return
+    blob = cache.new_blob()
+    try: copy_response_to_zip(response, zip_file_handle, zip_path, tee=blob)
+    except BaseException: blob.discard(); raise
+    cache.store(cache_key, blob, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+def render_pdf(content_bytes, config):
+    # Conversión HTML -> PDF en el pool de procesos compartido (ver sugos/pdf_render.py)
+    with metrics.measure("pdf_render") as sample:
+        pdf_bytes, error = pdf_render.render_html_to_pdf(
+            content_bytes,
+            workers=get_config_number(config, 'pdf_workers', pdf_render.DEFAULT_PDF_WORKERS, minimum=1),
+            timeout_seconds=get_config_number(config, 'pdf_timeout_seconds', pdf_render.DEFAULT_PDF_TIMEOUT_SECONDS, minimum=1),
+            memory_limit_mb=get_config_number(config, 'pdf_memory_limit_mb', pdf_render.DEFAULT_PDF_MEMORY_LIMIT_MB),
+            cache=pdf_cache.get_pdf_cache(
+                get_cache_dir(config),
+                get_config_number(config, 'pdf_cache_max_mb', pdf_cache.DEFAULT_PDF_CACHE_MAX_MB, cast=float),
+                get_config_number(config, 'pdf_cache_max_age_days', pdf_cache.DEFAULT_PDF_CACHE_MAX_AGE_DAYS, cast=float),
+            ),
+        )
+        sample.ok = error is None
+    return pdf_bytes, error
+
+def process_link_item(token, link_info, zip_file_handle, base_zip_path, config):
+    link_url = link_info["url"]; link_name = link_info["name"]
+    api_base_url = config.get('api_base_url')
+    if not api_base_url: report.error("Config inválida: falta api_base_url."); return False
+    headers = {}
+    try:
+        response = authorized_get(token, link_url, config, headers=headers, stream=True, timeout=http_timeout(config, 120)); response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '').lower()
+        # PDF Directo
+        if 'application/pdf' in content_type:
+            pdf_zip_path = base_zip_path + ".pdf"; copy_response_to_zip(response, zip_file_handle, pdf_zip_path); return True
+        # HTML
+        elif 'text/html' in content_type:
+            html_content = response.content; soup = BeautifulSoup(html_content, 'html.parser'); iframe = soup.find('iframe')
+            if iframe and iframe.get('src'): # Iframe encontrado
+                iframe_src = iframe['src']; iframe_url = urljoin(api_base_url, iframe_src)
+                try:
+                    with metrics.measure("iframe"):
+                        iframe_response = authorized_get(token, iframe_url, config, headers=headers, timeout=http_timeout(config, 120)); iframe_response.raise_for_status()
+                        iframe_content = iframe_response.content
+                    content_bytes = iframe_content if isinstance(iframe_content, bytes) else iframe_content.encode('utf-8')
+                    pdf_bytes, render_error = render_pdf(content_bytes, config)
+                    if render_error:
+                        report.error(f"Error convirtiendo iframe '{link_name}': {render_error}")
+                        fb_path = base_zip_path + "_iframe.html"; report.warning(f"Guardando iframe HTML: {fb_path}")
+                        zip_file_handle.writestr(fb_path, content_bytes); return False
+                    pdf_zip_path = base_zip_path + ".pdf"; zip_file_handle.writestr(pdf_zip_path, pdf_bytes); return True
+                except requests.exceptions.RequestException as e_iframe: report.error(f"Error descargando iframe '{link_name}': {e_iframe}"); return False
+                except Exception as e_conv: report.error(f"Error procesando iframe '{link_name}': {e_conv}"); return False
+            else: # Fallback HTML Principal
+                report.warning(f"No iframe en '{link_name}'. Convirtiendo HTML principal.")
+                content_bytes = html_content if isinstance(html_content, bytes) else html_content.encode('utf-8')
+                pdf_bytes, render_error = render_pdf(content_bytes, config)
+                if render_error:
+                    report.error(f"Error convirtiendo HTML principal '{link_name}': {render_error}")
+                    fb_path = base_zip_path + "_main.html"; report.warning(f"Guardando HTML principal: {fb_path}")
+                    zip_file_handle.writestr(fb_path, content_bytes); return False
+                pdf_zip_path = base_zip_path + ".pdf"; zip_file_handle.writestr(pdf_zip_path, pdf_bytes); return True
+        else: # Tipo Desconocido
+            report.warning(f"Tipo desconocido '{content_type}' para '{link_name}'. Guardando binario.")
+            fallback_zip_path = base_zip_path + ".bin"; copy_response_to_zip(response, zip_file_handle, fallback_zip_path); return True
+    except requests.exceptions.RequestException as e: report.error(f"Error procesando link '{link_name}': {e}"); return False
+    except Exception as e: report.error(f"Error inesperado procesando link '{link_name}': {e}"); return False
+
+# --- Pipeline ---
+def _init_pool_thread(reporter, run_metrics):
+    report.install(reporter); metrics.install(run_metrics)
+
+def make_thread_pool(max_workers):
+    # Los hilos heredan el reporter y las métricas del hilo que crea el pool (en la UI, también el contexto de Streamlit)
+    return ThreadPoolExecutor(max_workers=max_workers, initializer=_init_pool_thread, initargs=(report.current(), metrics.current()))
+
+def build_item_zip_path(item, sequence):
+    cedula = item["cedula"]; base_zip_path = f"{cedula}/{cedula}-{sequence}"
+    if item["type"] != "attachment": return base_zip_path
+    try: _, extension = os.path.splitext(item['file_name']); extension = extension.lower() or ".file"
+    except Exception: extension = ".file"
+    return base_zip_path + extension
+
+def item_key(item):
+    # Identidad estable de un elemento entre ejecuciones (manifiesto de la CLI por lotes)
+    if item["type"] == "attachment": return f"{item['cedula']}|attachment|{item.get('id')}|{item.get('download_url')}"
+    return f"{item['cedula']}|{item['type']}|{item.get('order_id')}|{item.get('url')}"
+
+def fetch_export_item(token, item, zip_path, config):
+    # Se ejecuta en un hilo de descarga: nunca toca el ZipFile real
+    staged = StagedZipEntries(get_config_number(config, 'staging_spool_max_bytes', DEFAULT_STAGING_SPOOL_MAX_BYTES))
+    with metrics.measure(item["type"]) as sample:
+        if item["type"] == "attachment": success = download_file_to_zip(token, item['download_url'], staged, zip_path, config, attachment_id=item.get('id'))
+        elif item["type"] == "link": success = process_link_item(token, item, staged, zip_path, config)
+        else: success = False
+        sample.ok = success
+    return success, staged
+
+def run_export_pipeline(token, cedulas, config, zip_file_handle, on_progress=None,
+                        skip_item=None, on_item_done=None, on_cedula_done=None, on_cedula_failed=None):
+    """Recopila metadatos y descarga elementos en pipeline con concurrencia acotada.
+
+    Las órdenes y detalles (Fase 1) se consultan en un pool; en cuanto una cédula
+    tiene todos sus detalles, sus elementos se numeran en el orden secuencial
+    (cédula -> orden -> anexos, links) y se envían al pool de descargas (Fase 2).
+    El hilo que llama es el único escritor del ZIP. `on_progress(fase, hechos, total)`
+    se invoca desde ese mismo hilo, igual que los ganchos opcionales:
+    `skip_item(item, zip_path)` descarta elementos ya exportados en esa ruta (cuentan como procesados),
+    `on_item_done(item, zip_paths, exito)` tras escribir cada elemento y
+    `on_cedula_done(cedula)` cuando una cédula queda completa. Si falla la consulta
+    de órdenes o de algún detalle de una cédula, se exportan los elementos obtenidos,
+    la cédula cuenta como un error, se llama a `on_cedula_failed(cedula)` y nunca a
+    `on_cedula_done`. Devuelve (original_links_display, total_items, processed_count, error_count).
+    """
+    phase1_workers = get_config_number(config, 'phase1_workers', DEFAULT_PHASE1_WORKERS, minimum=1)
+    phase2_workers = get_config_number(config, 'phase2_workers', DEFAULT_PHASE2_WORKERS, minimum=1)
+    orders_by_cedula = {}; details_by_order = {}; original_links_display = {ced: [] for ced in cedulas}
+    remaining = {ced: 1 for ced in cedulas}; outstanding = {ced: 0 for ced in cedulas}; cedulas_done = 0; lookup_failed = set()
+    total_items = 0; items_done = 0; processed_count = 0; error_count = 0
+    run_metrics = metrics.current(); started = time.time(); first_item_queued = None
+
+    def queue_cedula_items(cedula):
+        # Ensamblar en orden determinista (mantiene la numeración de file_sequence)
+        nonlocal total_items, items_done, processed_count, first_item_queued; sequence = 0
+        for idx, order in enumerate(orders_by_cedula.get(cedula, [])):
+            order_id = order.get("id")
+            if not order_id: continue
+            attachments, links = details_by_order.get((cedula, idx), ([], []))
+            if links: original_links_display[cedula].append({"order_id": order_id, "links": links})
+            for item in list(attachments) + list(links):
+                item["cedula"] = cedula; sequence += 1; total_items += 1; zip_path = build_item_zip_path(item, sequence)
+                if skip_item is not None and skip_item(item, zip_path): items_done += 1; processed_count += 1; continue
+                outstanding[cedula] += 1
+                if first_item_queued is None: first_item_queued = time.time()
+                pending[download_pool.submit(fetch_export_item, token, item, zip_path, config)] = ("item", cedula, item)
+
+    def check_cedula_done(cedula):
+        if cedula in lookup_failed: return
+        if on_cedula_done and remaining[cedula] == 0 and outstanding[cedula] == 0: on_cedula_done(cedula)
+
+    with make_thread_pool(phase1_workers) as metadata_pool, make_thread_pool(phase2_workers) as download_pool:
+        pending = {metadata_pool.submit(get_orders_for_cedula, token, ced, config): ("orders", ced, None) for ced in cedulas}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, cedula, detail = pending.pop(future)
+                    if kind == "item":
+                        success, staged = future.result(); zip_paths = []
+                        try: zip_paths = staged.commit(zip_file_handle)
+                        except Exception as e: report.error(f"Error añadiendo elemento de {cedula} al zip: {e}"); success = False; staged.discard()
+                        if success: processed_count += 1
+                        else: error_count += 1
+                        items_done += 1; outstanding[cedula] -= 1
+                        if on_item_done: on_item_done(detail, zip_paths, success)
+                        if on_progress: on_progress(2, items_done, total_items)
+                        check_cedula_done(cedula)
+                        continue
+                    if kind == "orders":
+                        orders = future.result()
+                        if orders is None: lookup_failed.add(cedula); orders = []
+                        orders_by_cedula[cedula] = orders
+                        for idx, order in enumerate(orders):
+                            order_id = order.get("id")
+                            if not order_id: continue
+                            remaining[cedula] += 1
+                            pending[metadata_pool.submit(get_order_details_and_attachments, token, order_id, config)] = ("details", cedula, idx)
+                    else:
+                        details = future.result()
+                        if details is None: lookup_failed.add(cedula); details = ([], [])
+                        details_by_order[(cedula, detail)] = details
+                    remaining[cedula] -= 1
+                    if remaining[cedula] == 0:
+                        queue_cedula_items(cedula); cedulas_done += 1
+                        if cedula in lookup_failed:
+                            error_count += 1
+                            if on_cedula_failed: on_cedula_failed(cedula)
+                        if cedulas_done == len(cedulas): run_metrics.phase_span("fase1", started, time.time())
+                        if on_progress: on_progress(1, cedulas_done, len(cedulas))
+                        check_cedula_done(cedula)
+        finally:
+            # Si algo falla, no dejar descargas pendientes ni temporales abiertos
+            for future in pending: future.cancel()
+            if first_item_queued is not None: run_metrics.phase_span("fase2", first_item_queued, time.time())
+    return original_links_display, total_items, processed_count, error_count
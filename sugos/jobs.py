@@ -0,0 +1,250 @@
+# --- Cola de Exportaciones en Segundo Plano ---
+# Las exportaciones de la app se encolan y las ejecuta un pool de hilos del proceso, fuera del hilo
+# del script de Streamlit: sobreviven a reruns y recargas del navegador. La cola es acotada, los
+# hilos se reparten por turnos entre usuarios (un usuario con muchos trabajos no bloquea a otro) y
+# el estado de cada trabajo se guarda en `<cache_dir>/jobs/<id>/estado.json` para consultarlo
+# desde cualquier rerun. Los ZIP terminados quedan en disco hasta que vence su TTL.
+import os
+import json
+import time
+import uuid
+import shutil
+import datetime
+import tempfile
+import threading
+import collections
+
+from sugos import metrics, report
+from sugos.archive import DEFAULT_UI_ZIP_SPLIT_MAX_MB, ExportArchive
+from sugos.export import run_export_pipeline
+
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_JOB_QUEUE_MAX = 20
+DEFAULT_JOB_QUEUE_MAX_PER_USER = 3
+DEFAULT_JOB_RESULT_TTL_HOURS = 24
+DEFAULT_JOB_POLL_SECONDS = 2  # Refresco de la sección de exportaciones en la UI mientras hay trabajos activos
+STATE_FILENAME = "estado.json"
+MAX_JOB_MESSAGES = 200
+PERSIST_INTERVAL_SECONDS = 1.0
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "en_cola", "en_curso", "terminado", "fallido", "cancelado"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+class JobQueueFull(Exception):
+    pass
+
+class JobCancelled(Exception):
+    pass
+
+class JobReporter:
+    """Guarda los mensajes del motor en el trabajo (la UI los muestra al consultarlo)."""
+    def __init__(self, job):
+        self.job = job
+
+    def _add(self, level, message):
+        messages = self.job.state["messages"]; messages.append({"level": level, "message": str(message)})
+        if len(messages) > MAX_JOB_MESSAGES: del messages[:len(messages) - MAX_JOB_MESSAGES]
+
+    def error(self, message): self._add("error", message)
+    def warning(self, message): self._add("warning", message)
+    def success(self, message): self._add("success", message)
+    def info(self, message): self._add("info", message)
+
+class ExportJob:
+    def __init__(self, directory, state, token=None, config=None):
+        self.directory = directory; self.state = state; self.token = token; self.config = config
+        self.cancel_requested = False; self._last_persist = 0.0
+
+    @property
+    def id(self): return self.state["id"]
+
+    @property
+    def owner(self): return self.state["owner"]
+
+    def persist(self, force=True):
+        # Escritura atómica; durante el progreso se limita a una vez por segundo
+        now = time.monotonic()
+        if not force and now - self._last_persist < PERSIST_INTERVAL_SECONDS: return
+        self._last_persist = now
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        with os.fdopen(fd, "w", encoding="utf-8") as state_file: json.dump(self.state, state_file, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.directory, STATE_FILENAME))
+
+    def part_paths(self):
+        return [os.path.join(self.directory, name) for name in self.state.get("parts", [])]
+
+class JobManager:
+    def __init__(self, directory, workers=DEFAULT_JOB_WORKERS, queue_max=DEFAULT_JOB_QUEUE_MAX,
+                 queue_max_per_user=DEFAULT_JOB_QUEUE_MAX_PER_USER, result_ttl_seconds=DEFAULT_JOB_RESULT_TTL_HOURS * 3600):
+        # Los ZIP contienen anexos de clientes: directorios 0o700 y archivos 0o600 (solo el usuario de la app)
+        self.directory = directory; os.makedirs(directory, mode=0o700, exist_ok=True); os.chmod(directory, 0o700)
+        self.queue_max = queue_max; self.queue_max_per_user = queue_max_per_user; self.result_ttl_seconds = result_ttl_seconds
+        self._cond = threading.Condition(); self.jobs = {}
+        self._pending = {}  # owner -> deque de trabajos en espera
+        self._running = collections.Counter(); self._last_served = {}; self._turns = 0; self._workers = []
+        self._load()
+        self.ensure_workers(workers)
+
+    def _load(self):
+        # Trabajos de una ejecución anterior del proceso: los no terminados no pueden retomarse (el token no se guarda)
+        for job_id in os.listdir(self.directory):
+            job_dir = os.path.join(self.directory, job_id)
+            try:
+                with open(os.path.join(job_dir, STATE_FILENAME), encoding="utf-8") as state_file: state = json.load(state_file)
+            except (OSError, ValueError): shutil.rmtree(job_dir, ignore_errors=True); continue
+            job = ExportJob(job_dir, state)
+            if state["status"] not in FINISHED_STATES:
+                state["status"] = FAILED; state["finished"] = time.time()
+                JobReporter(job).error("La exportación se interrumpió porque la aplicación se reinició. Vuelva a lanzarla.")
+                job.persist()
+            self.jobs[job.id] = job
+
+    def ensure_workers(self, workers):
+        # El pool solo crece: reducir 'job_workers' surte efecto al reiniciar la app
+        with self._cond:
+            while len(self._workers) < workers:
+                worker = threading.Thread(target=self._worker_loop, name=f"sugos-job-{len(self._workers) + 1}", daemon=True)
+                self._workers.append(worker); worker.start()
+
+    def submit(self, owner, config, token, cedulas, file_tag="export"):
+        """Encola una exportación y devuelve el trabajo. JobQueueFull si la cola (global o del usuario) está llena."""
+        self.purge_expired()
+        with self._cond:
+            queued = sum(len(pending) for pending in self._pending.values())
+            if queued >= self.queue_max: raise JobQueueFull(f"La cola de exportaciones está llena ({queued} en espera).")
+            if len(self._pending.get(owner, ())) >= self.queue_max_per_user:
+                raise JobQueueFull(f"Ya tiene {self.queue_max_per_user} exportaciones en espera.")
+            job_id = uuid.uuid4().hex; job_dir = os.path.join(self.directory, job_id); os.makedirs(job_dir, mode=0o700)
+            job = ExportJob(job_dir, {
+                "id": job_id, "owner": owner, "environment": config.get('display_name', ''), "file_tag": file_tag, "status": QUEUED,
+                "created": time.time(), "started": None, "finished": None, "cedulas": list(cedulas),
+                "progress": {"cedulas_done": 0, "cedulas_total": len(cedulas), "items_done": 0, "items_total": 0},
+                "total_items": 0, "processed": 0, "errors": 0, "parts": [], "links": {}, "performance": None, "messages": [],
+            }, token, config)
+            job.persist(); self.jobs[job_id] = job
+            self._pending.setdefault(owner, collections.deque()).append(job); self._cond.notify()
+            return job
+
+    def _next_job_locked(self):
+        # Turno justo: el usuario con menos trabajos en curso; a igualdad, el atendido hace más tiempo
+        if not self._pending: return None
+        owner = min(self._pending, key=lambda candidate: (self._running[candidate], self._last_served.get(candidate, 0)))
+        pending = self._pending[owner]; job = pending.popleft()
+        if not pending: del self._pending[owner]
+        self._turns += 1; self._last_served[owner] = self._turns; self._running[owner] += 1
+        return job
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_job_locked()
+                while job is None: self._cond.wait(); job = self._next_job_locked()
+            try: self._run(job)
+            finally:
+                with self._cond:
+                    self._running[job.owner] -= 1
+                    if self._running[job.owner] <= 0: del self._running[job.owner]
+                    self._cond.notify()
+
+    def _run(self, job):
+        state = job.state
+        if job.cancel_requested: state["status"] = CANCELLED; state["finished"] = time.time(); job.persist(); return
+        state["status"] = RUNNING; state["started"] = time.time(); job.persist()
+        progress = state["progress"]
+        def on_progress(phase, done_count, total):
+            if job.cancel_requested: raise JobCancelled()
+            if phase == 1: progress["cedulas_done"] = done_count; progress["cedulas_total"] = total
+            else: progress["items_done"] = done_count; progress["items_total"] = total
+            job.persist(force=False)
+        def open_part(number):
+            state["parts"].append(f"parte{number}.zip.part")
+            fd = os.open(os.path.join(job.directory, state["parts"][-1]), os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600); return os.fdopen(fd, "w+b")
+        run_metrics = metrics.RunMetrics(); export_archive = ExportArchive(job.config, open_part=open_part, default_split_max_mb=DEFAULT_UI_ZIP_SPLIT_MAX_MB)
+        try:
+            with report.using(JobReporter(job)), metrics.using(run_metrics):
+                with export_archive:
+                    links, total_items, processed, errors = run_export_pipeline(job.token, state["cedulas"], job.config, export_archive, on_progress=on_progress)
+                    performance = run_metrics.summary(items={"total": total_items, "processed": processed, "errors": errors})
+                    if processed > 0: export_archive.writestr(metrics.REPORT_FILENAME, json.dumps(performance, indent=2, ensure_ascii=False))
+            for part in export_archive.parts: part.close()
+            # Partes definitivas con el nombre de descarga (un solo ZIP si no se dividió)
+            timestamp = datetime.datetime.fromtimestamp(state["created"]).strftime("%Y%m%d_%H%M%S")
+            base_name = f"sugos_export_{state['file_tag']}_{timestamp}"; final_names = []
+            for number, tmp_name in enumerate(state["parts"], start=1):
+                final_name = f"{base_name}.zip" if len(state["parts"]) == 1 else f"{base_name}_parte{number}.zip"
+                os.replace(os.path.join(job.directory, tmp_name), os.path.join(job.directory, final_name)); final_names.append(final_name)
+            state.update(parts=final_names if processed > 0 else [], links=links, total_items=total_items, processed=processed,
+                         errors=errors, performance=performance, status=DONE)
+            if processed == 0: self._remove_parts(job, final_names)
+        except JobCancelled:
+            for part in export_archive.parts: part.close()
+            self._remove_parts(job, state["parts"]); state.update(parts=[], status=CANCELLED)
+        except Exception as e:
+            for part in export_archive.parts: part.close()
+            self._remove_parts(job, state["parts"]); state.update(parts=[], status=FAILED)
+            JobReporter(job).error(f"Error inesperado en la exportación: {e}")
+        finally:
+            state["finished"] = time.time(); job.token = None; job.config = None; job.persist()
+
+    @staticmethod
+    def _remove_parts(job, names):
+        for name in names:
+            try: os.remove(os.path.join(job.directory, name))
+            except FileNotFoundError: pass
+
+    def cancel(self, job_id, owner):
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.owner != owner or job.state["status"] in FINISHED_STATES: return False
+            job.cancel_requested = True
+            pending = self._pending.get(owner)
+            if pending and job in pending:
+                pending.remove(job)
+                if not pending: del self._pending[owner]
+                job.state.update(status=CANCELLED, finished=time.time()); job.persist()
+            return True
+
+    def queue_position(self, job):
+        # Posición aproximada: trabajos en espera por delante en el orden de turnos
+        with self._cond:
+            if job.state["status"] != QUEUED: return 0
+            position = 0
+            for pending in self._pending.values():
+                position += sum(1 for other in pending if other.state["created"] < job.state["created"])
+            return position + 1
+
+    def jobs_for(self, owner):
+        """Trabajos del usuario, del más reciente al más antiguo (tras purgar los vencidos)."""
+        self.purge_expired()
+        with self._cond: owned = [job for job in self.jobs.values() if job.owner == owner]
+        return sorted(owned, key=lambda job: job.state["created"], reverse=True)
+
+    def remove(self, job_id, owner):
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.owner != owner or job.state["status"] not in FINISHED_STATES: return False
+            del self.jobs[job_id]
+        shutil.rmtree(job.directory, ignore_errors=True); return True
+
+    def purge_expired(self):
+        now = time.time()
+        with self._cond:
+            expired = [job for job in self.jobs.values()
+                       if job.state["status"] in FINISHED_STATES and now - (job.state["finished"] or now) > self.result_ttl_seconds]
+            for job in expired: del self.jobs[job.id]
+        for job in expired: shutil.rmtree(job.directory, ignore_errors=True)
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_job_manager(directory, workers=DEFAULT_JOB_WORKERS, queue_max=DEFAULT_JOB_QUEUE_MAX,
+                    queue_max_per_user=DEFAULT_JOB_QUEUE_MAX_PER_USER, result_ttl_hours=DEFAULT_JOB_RESULT_TTL_HOURS):
+    """Gestor compartido por proceso (todas las sesiones de Streamlit) para un directorio."""
+    directory = os.path.join(directory, "jobs")
+    with _managers_lock:
+        manager = _managers.get(directory)
+        if manager is None: manager = _managers[directory] = JobManager(directory, max(1, workers))
+        else: manager.ensure_workers(max(1, workers))
+        manager.queue_max = max(1, queue_max); manager.queue_max_per_user = max(1, queue_max_per_user)
+        manager.result_ttl_seconds = max(0, result_ttl_hours) * 3600
+        return manager
@@ -0,0 +1,128 @@
+# --- Control Adaptativo de Concurrencia hacia el CRM ---
+# Un limitador por entorno (api_base_url), compartido por todas las peticiones del proceso: login,
+# órdenes, detalles, anexos, links e iframes, de todas las sesiones y de la CLI.
+# AIMD: mientras la latencia reciente se mantiene cerca de la habitual, el límite de peticiones
+# simultáneas crece en +1 por cada "ventana" de respuestas correctas; ante 429/5xx, timeouts o un
+# salto de latencia se reduce multiplicativamente. Un Retry-After del servidor pausa a todos.
+import time
+import threading
+import contextlib
+
+from urllib3.util.retry import Retry
+
+from sugos import metrics
+
+DEFAULT_LIMITER_INITIAL = 4
+DEFAULT_LIMITER_MIN = 1
+DEFAULT_LIMITER_LATENCY_TOLERANCE = 2.0   # Degradación: latencia reciente > latencia habitual x tolerancia
+DEFAULT_LIMITER_BACKOFF_RATIO = 0.5       # Factor multiplicativo al reducir
+MAX_RETRY_AFTER_SECONDS = 300
+OVERLOAD_STATUS_CODES = (429, 500, 502, 503, 504)
+LATENCY_SMOOTHING = 0.2                   # Media móvil exponencial de corto plazo (latencia reciente)
+BASELINE_SMOOTHING = 0.02                 # Media de largo plazo (latencia habitual)
+WARMUP_SAMPLES = 20                       # Respuestas antes de juzgar la latencia (conexiones nuevas, arranque)
+
+_thread_state = threading.local()
+
+class AdaptiveLimiter:
+    def __init__(self, max_limit, min_limit=DEFAULT_LIMITER_MIN, initial=DEFAULT_LIMITER_INITIAL,
+                 latency_tolerance=DEFAULT_LIMITER_LATENCY_TOLERANCE, backoff_ratio=DEFAULT_LIMITER_BACKOFF_RATIO):
+        self._cond = threading.Condition(); self.in_flight = 0; self.paused_until = 0.0
+        self.latency = None; self.baseline = None; self.samples = 0; self._last_decrease = 0.0
+        self.decreases = 0; self.configure(max_limit, min_limit, latency_tolerance, backoff_ratio)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+
+    def configure(self, max_limit, min_limit=DEFAULT_LIMITER_MIN, latency_tolerance=DEFAULT_LIMITER_LATENCY_TOLERANCE,
+                  backoff_ratio=DEFAULT_LIMITER_BACKOFF_RATIO):
+        max_limit = max(1, max_limit); params = (max_limit, max(1, min(min_limit, max_limit)),
+                                                 max(1.0, latency_tolerance), min(max(backoff_ratio, 0.1), 0.95))
+        # Se llama en cada petición (get_limiter): sin cambios no se despierta a los hilos en espera
+        if params == getattr(self, "_params", None): return
+        with self._cond:
+            self._params = params; self.max_limit, self.min_limit, self.latency_tolerance, self.backoff_ratio = params
+            if hasattr(self, "limit"): self.limit = min(max(self.limit, self.min_limit), self.max_limit)
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Reserva un lugar hasta recibir la respuesta (cabeceras); la latencia medida alimenta el límite."""
+        requested = time.monotonic(); blocked = False
+        with self._cond:
+            while True:
+                wait_seconds = self.paused_until - time.monotonic()
+                if wait_seconds <= 0 and self.in_flight < int(self.limit): break
+                blocked = True; self._cond.wait(timeout=wait_seconds if wait_seconds > 0 else None)
+            self.in_flight += 1
+        start = time.monotonic(); failed = False; overloads = getattr(_thread_state, "overloads", 0)
+        if blocked: metrics.record_wait(start - requested)
+        try: yield self
+        except Exception: failed = True; raise
+        finally:
+            # Con 429/5xx intermedios la latencia incluye las esperas de reintento: ya se redujo en on_retry
+            retried = getattr(_thread_state, "overloads", 0) != overloads
+            with self._cond:
+                self.in_flight -= 1
+                if failed: self._decrease_locked()
+                elif not retried: self._observe_locked(time.monotonic() - start)
+                self._cond.notify_all()
+
+    def on_retry(self, response=None, error=None, retry_after=None):
+        # Llamado por FeedbackRetry en cada intento fallido (también en el último, aunque no se reintente)
+        if response is not None and response.status not in OVERLOAD_STATUS_CODES: return
+        metrics.count("http_overload_responses" if response is not None else "http_connection_errors")
+        _thread_state.overloads = getattr(_thread_state, "overloads", 0) + 1
+        with self._cond:
+            self._decrease_locked()
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + min(retry_after, MAX_RETRY_AFTER_SECONDS))
+            self._cond.notify_all()
+
+    def _observe_locked(self, latency):
+        self.samples += 1
+        if self.latency is None: self.latency = self.baseline = latency
+        else:
+            self.latency += (latency - self.latency) * LATENCY_SMOOTHING; self.baseline += (latency - self.baseline) * BASELINE_SMOOTHING
+        if self.samples > WARMUP_SAMPLES and self.latency > self.baseline * self.latency_tolerance: self._decrease_locked()
+        else: self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _decrease_locked(self):
+        # Una reducción por ventana (~ una latencia): una ráfaga de errores no colapsa el límite a 1
+        now = time.monotonic()
+        if now - self._last_decrease < max(self.latency or 0.0, 0.05): return
+        self._last_decrease = now; self.decreases += 1; metrics.count("limiter_backoffs")
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+
+    def snapshot(self):
+        with self._cond:
+            return {"limit": round(self.limit, 2), "in_flight": self.in_flight, "decreases": self.decreases,
+                    "latency_ms": round((self.latency or 0) * 1000, 1), "baseline_ms": round((self.baseline or 0) * 1000, 1)}
+
+class FeedbackRetry(Retry):
+    """Retry de urllib3 que informa al limitador de cada 429/5xx o error de conexión (con su Retry-After)."""
+    def __init__(self, *args, limiter=None, **kwargs):
+        super().__init__(*args, **kwargs); self.limiter = limiter
+
+    def new(self, **kw):
+        retry = super().new(**kw); retry.limiter = self.limiter; return retry
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if self.limiter is not None:
+            retry_after = None
+            if response is not None and response.headers.get("Retry-After"):
+                try: retry_after = self.parse_retry_after(response.headers["Retry-After"])
+                except Exception: retry_after = None
+            self.limiter.on_retry(response, error, retry_after)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(api_base_url, max_limit, min_limit=DEFAULT_LIMITER_MIN, initial=DEFAULT_LIMITER_INITIAL,
+                latency_tolerance=DEFAULT_LIMITER_LATENCY_TOLERANCE, backoff_ratio=DEFAULT_LIMITER_BACKOFF_RATIO):
+    """Limitador compartido por proceso para un entorno; conserva lo aprendido entre ejecuciones."""
+    with _limiters_lock:
+        limiter = _limiters.get(api_base_url)
+        if limiter is None:
+            limiter = _limiters[api_base_url] = AdaptiveLimiter(max_limit, min_limit, initial, latency_tolerance, backoff_ratio)
+        else: limiter.configure(max_limit, min_limit, latency_tolerance, backoff_ratio)
+        return limiter
@@ -0,0 +1,141 @@
+# --- Métricas de Rendimiento por Ejecución ---
+# Cada petición o conversión se mide con `metrics.measure(tipo)`: latencia, bytes transferidos,
+# reintentos y resultado, agrupados por fase. Las respuestas HTTP obtenidas dentro del bloque se
+# asocian a la medición con `metrics.track(response)` (lo hace `crm.authorized_get`).
+# Igual que el reporter (sugos/report.py), las métricas de la ejecución se instalan en el hilo
+# que la lanza y los pools del motor las heredan.
+import time
+import math
+import datetime
+import threading
+import contextlib
+
+# Fase a la que pertenece cada tipo de medición
+KIND_PHASES = {
+    "login": "auth", "orders": "fase1", "details": "fase1",
+    "attachment": "fase2", "link": "fase2", "iframe": "fase2", "pdf_render": "fase2",
+}
+PERCENTILES = (50, 90, 95, 99)
+REPORT_FILENAME = "reporte_rendimiento.json"
+
+def _percentile(sorted_values, percentile):
+    # Interpolación lineal entre rangos (como numpy.percentile por defecto)
+    if not sorted_values: return 0.0
+    position = (len(sorted_values) - 1) * percentile / 100; lower = math.floor(position); upper = math.ceil(position)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+class Sample:
+    """Medición en curso; `track(response)` toma bytes y reintentos de la respuesta HTTP."""
+    def __init__(self):
+        self.nbytes = 0; self.retries = 0; self.ok = True; self.waited = 0.0; self._responses = []
+
+    def track(self, response):
+        self._responses.append(response); return response
+
+    def add_bytes(self, nbytes):
+        self.nbytes += nbytes
+
+    def _collect(self):
+        for response in self._responses:
+            raw = getattr(response, "raw", None)
+            try: self.nbytes += raw.tell() if raw is not None and hasattr(raw, "tell") else len(response.content or b"")
+            except Exception: pass
+            retry_state = getattr(raw, "retries", None)
+            self.retries += len(getattr(retry_state, "history", None) or ())
+            if getattr(response, "status_code", 200) >= 400 and response.status_code != 304: self.ok = False
+
+class RunMetrics:
+    def __init__(self):
+        self._lock = threading.Lock(); self.started = time.time()
+        self.samples = {}; self.counters = {}; self.phases = {}
+
+    @contextlib.contextmanager
+    def measure(self, kind):
+        sample = Sample(); start = time.perf_counter(); stack = _active_samples(); stack.append(sample)
+        try: yield sample
+        except BaseException: sample.ok = False; raise
+        finally:
+            # La espera de turno del limitador no es latencia del CRM (se informa aparte, ver record_wait)
+            stack.pop(); elapsed = max(0.0, time.perf_counter() - start - sample.waited); sample._collect()
+            with self._lock: self.samples.setdefault(kind, []).append((elapsed, sample.nbytes, sample.retries, sample.ok))
+
+    def count(self, name, amount=1):
+        with self._lock: self.counters[name] = self.counters.get(name, 0) + amount
+
+    def phase_span(self, phase, start, end):
+        # Tiempo de pared de una fase (time.time()); se amplía si la fase se registra varias veces
+        with self._lock:
+            previous = self.phases.get(phase)
+            self.phases[phase] = (min(start, previous[0]), max(end, previous[1])) if previous else (start, end)
+
+    def summary(self, items=None):
+        """Resumen serializable a JSON: latencias en ms con percentiles, bytes y rendimiento por tipo y fase."""
+        with self._lock: samples = {kind: list(values) for kind, values in self.samples.items()}; counters = dict(self.counters); phases = dict(self.phases)
+        counters = {name: round(value, 3) if isinstance(value, float) else value for name, value in counters.items()}
+        wall_seconds = time.time() - self.started
+        by_kind = {}; phase_bytes = {}; phase_busy = {}
+        for kind, values in sorted(samples.items()):
+            latencies = sorted(value[0] for value in values); total_bytes = sum(value[1] for value in values)
+            phase = KIND_PHASES.get(kind, "otros"); phase_bytes[phase] = phase_bytes.get(phase, 0) + total_bytes
+            phase_busy[phase] = phase_busy.get(phase, 0) + sum(latencies)
+            by_kind[kind] = {
+                "phase": phase, "count": len(values), "errors": sum(1 for value in values if not value[3]),
+                "retries": sum(value[2] for value in values), "bytes": total_bytes,
+                "latency_ms": dict({f"p{p}": round(_percentile(latencies, p) * 1000, 1) for p in PERCENTILES},
+                                   mean=round(sum(latencies) / len(latencies) * 1000, 1), max=round(latencies[-1] * 1000, 1)),
+                "busy_seconds": round(sum(latencies), 3),
+            }
+        phase_summary = {}
+        # Fases sin intervalo registrado (p. ej. auth, secuencial): se usa el tiempo de sus peticiones
+        for phase in sorted(set(phases) | set(phase_busy)):
+            seconds = max(phases[phase][1] - phases[phase][0] if phase in phases else phase_busy[phase], 1e-9)
+            phase_summary[phase] = {"seconds": round(seconds, 3), "bytes": phase_bytes.get(phase, 0),
+                                    "throughput_mb_s": round(phase_bytes.get(phase, 0) / seconds / (1024 * 1024), 3)}
+        report = {
+            "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "wall_seconds": round(wall_seconds, 3), "phases": phase_summary, "requests": by_kind, "counters": counters,
+        }
+        if items is not None:
+            report["items"] = dict(items, items_per_second=round(items.get("total", 0) / wall_seconds, 3) if wall_seconds else 0)
+        return report
+
+class NullMetrics:
+    """Métricas desactivadas (valor por defecto si no hay una ejecución instalada)."""
+    @contextlib.contextmanager
+    def measure(self, kind): yield Sample()
+    def count(self, name, amount=1): pass
+    def phase_span(self, phase, start, end): pass
+
+_null_metrics = NullMetrics()
+_thread_state = threading.local()
+
+def _active_samples():
+    if not hasattr(_thread_state, "samples"): _thread_state.samples = []
+    return _thread_state.samples
+
+def current():
+    return getattr(_thread_state, "metrics", None) or _null_metrics
+
+def install(metrics):
+    _thread_state.metrics = metrics
+
+@contextlib.contextmanager
+def using(metrics):
+    previous = getattr(_thread_state, "metrics", None); install(metrics)
+    try: yield metrics
+    finally: _thread_state.metrics = previous
+
+def measure(kind): return current().measure(kind)
+def count(name, amount=1): current().count(name, amount)
+
+def record_wait(seconds):
+    # Espera local por un turno del limitador (o una pausa por Retry-After): se descuenta de las
+    # mediciones activas de este hilo y se acumula en los contadores 'limiter_waits'/'limiter_wait_seconds'
+    for sample in _active_samples(): sample.waited += seconds
+    count("limiter_waits"); count("limiter_wait_seconds", float(seconds))
+
+def track(response):
+    # Asocia la respuesta a la medición activa más interna de este hilo (si la hay)
+    stack = _active_samples()
+    if stack: stack[-1].track(response)
+    return response
@@ -0,0 +1,94 @@
+# --- Caché de PDFs Renderizados ---
+# Clave: SHA-256 del HTML descargado + versión del renderizador. Guarda también los fallos de
+# conversión (entradas negativas) para no reintentar páginas que se sabe que no convierten.
+# Se expulsan las entradas más antiguas que la edad máxima y luego las menos usadas (LRU) por tamaño.
+import os
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+
+DEFAULT_PDF_CACHE_MAX_MB = 512
+DEFAULT_PDF_CACHE_MAX_AGE_DAYS = 30
+
+class PdfCache:
+    def __init__(self, directory, max_bytes, max_age_seconds):
+        self.directory = directory; self.max_bytes = max_bytes; self.max_age_seconds = max_age_seconds
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"), timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS renders (key TEXT PRIMARY KEY, error TEXT, size INTEGER NOT NULL, "
+                             "created REAL NOT NULL, last_access REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS renders_lru ON renders (last_access)")
+
+    @staticmethod
+    def make_key(content_bytes, renderer_version):
+        digest = hashlib.sha256(renderer_version.encode("utf-8") + b"\0"); digest.update(content_bytes)
+        return digest.hexdigest()
+
+    def _pdf_path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".pdf")
+
+    def get(self, key):
+        """(pdf_bytes, None) si hay PDF, (None, error) si es un fallo conocido, None si no está o caducó."""
+        with self._lock:
+            row = self._db.execute("SELECT error, created FROM renders WHERE key = ?", (key,)).fetchone()
+        if row is None: return None
+        error, created = row
+        if self.max_age_seconds and time.time() - created > self.max_age_seconds: self._delete(key); return None
+        if error is None:
+            try:
+                with open(self._pdf_path(key), "rb") as pdf_file: pdf_bytes = pdf_file.read()
+            except FileNotFoundError: self._delete(key); return None
+        else: pdf_bytes = None
+        with self._lock, self._db: self._db.execute("UPDATE renders SET last_access = ? WHERE key = ?", (time.time(), key))
+        return pdf_bytes, error
+
+    def put_pdf(self, key, pdf_bytes):
+        pdf_path = self._pdf_path(key); os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(pdf_path), suffix=".part")
+        with os.fdopen(fd, "wb") as tmp_file: tmp_file.write(pdf_bytes)
+        os.replace(tmp_path, pdf_path); self._put(key, None, len(pdf_bytes))
+
+    def put_failure(self, key, error):
+        self._put(key, str(error), 0)
+
+    def _put(self, key, error, size):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO renders (key, error, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                             (key, error, size, now, now))
+            self._evict_locked()
+
+    def _delete(self, key):
+        with self._lock, self._db: self._delete_locked(key)
+
+    def _delete_locked(self, key):
+        self._db.execute("DELETE FROM renders WHERE key = ?", (key,))
+        try: os.remove(self._pdf_path(key))
+        except FileNotFoundError: pass
+
+    def _evict_locked(self):
+        if self.max_age_seconds:
+            expired = self._db.execute("SELECT key FROM renders WHERE created < ?", (time.time() - self.max_age_seconds,)).fetchall()
+            for (key,) in expired: self._delete_locked(key)
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM renders").fetchone()[0]
+        if total <= self.max_bytes: return
+        for key, size in self._db.execute("SELECT key, size FROM renders WHERE size > 0 ORDER BY last_access").fetchall():
+            if total <= self.max_bytes: break
+            self._delete_locked(key); total -= size
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_pdf_cache(directory, max_mb=DEFAULT_PDF_CACHE_MAX_MB, max_age_days=DEFAULT_PDF_CACHE_MAX_AGE_DAYS):
+    """Caché compartida por proceso para un directorio; None si está desactivada (max_mb <= 0)."""
+    if not max_mb or max_mb <= 0: return None
+    directory = os.path.join(directory, "pdfs")
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None: cache = _caches[directory] = PdfCache(directory, 0, 0)
+        cache.max_bytes = int(max_mb * 1024 * 1024); cache.max_age_seconds = max(0, max_age_days) * 86400
+        return cache
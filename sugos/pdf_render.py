@@ -0,0 +1,147 @@
+# --- Servicio de Conversión HTML -> PDF en Procesos ---
+# pisa.CreatePDF es Python puro y acapara el GIL: se ejecuta en un pool de procesos
+# compartido por todas las sesiones del servidor, con timeout y límite de memoria.
+import io
+import os
+import queue
+import signal
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import xhtml2pdf
+from xhtml2pdf import pisa
+
+try: import resource
+except ImportError: resource = None  # Windows: sin límite de memoria por proceso
+
+DEFAULT_PDF_WORKERS = max(1, min(4, os.cpu_count() or 1))
+DEFAULT_PDF_TIMEOUT_SECONDS = 60
+DEFAULT_PDF_MEMORY_LIMIT_MB = 1024
+# Cambia al modificar la forma de convertir: invalida los PDFs guardados en la caché
+RENDERER_VERSION = f"xhtml2pdf-{getattr(xhtml2pdf, '__version__', '?')}/1"
+# Margen extra que espera el proceso principal antes de dar por colgado un worker
+PARENT_TIMEOUT_GRACE_SECONDS = 10
+
+class RenderTimeout(Exception):
+    pass
+
+def _mp_context():
+    # Streamlit registra el script como sys.modules['__main__'], y con 'spawn'/'forkserver' los hijos
+    # lo re-ejecutarían. En POSIX se usa 'fork': los workers solo heredan este módulo ya importado.
+    if "fork" in multiprocessing.get_all_start_methods(): return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+def _address_space_bytes():
+    try:
+        with open("/proc/self/statm") as statm: return int(statm.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError): return None
+
+def _init_worker(memory_limit_mb):
+    # El límite se suma a lo heredado del proceso padre (con 'fork' el espacio de direcciones ya es grande)
+    if resource is None or not memory_limit_mb: return
+    baseline = _address_space_bytes()
+    if baseline is None: return
+    limit = baseline + int(memory_limit_mb) * 1024 * 1024
+    try: resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, OSError): pass
+
+def _on_alarm(signum, frame):
+    raise RenderTimeout()
+
+def _render_in_worker(content_bytes, timeout_seconds):
+    # Se ejecuta en el hilo principal del proceso hijo, por lo que SIGALRM puede cortar la conversión
+    use_alarm = hasattr(signal, "setitimer")
+    if use_alarm: signal.signal(signal.SIGALRM, _on_alarm); signal.setitimer(signal.ITIMER_REAL, timeout_seconds)
+    try:
+        pdf_buffer = io.BytesIO()
+        pisa_status = pisa.CreatePDF(io.BytesIO(content_bytes), dest=pdf_buffer, encoding='utf-8')
+        if pisa_status.err: return None, f"{pisa_status.err} error(es) de conversión", True
+        return pdf_buffer.getvalue(), None, True
+    # Timeout y memoria dependen de la configuración: no se guardan como fallos definitivos
+    except RenderTimeout: return None, f"Tiempo de conversión agotado ({timeout_seconds}s)", False
+    except MemoryError: return None, "Límite de memoria de conversión excedido", False
+    finally:
+        if use_alarm: signal.setitimer(signal.ITIMER_REAL, 0)
+
+class _RenderPool:
+    """`workers` procesos de conversión, cada uno en su propio ProcessPoolExecutor de un worker.
+
+    Cada conversión toma un worker libre (la espera por uno no cuenta para el timeout) y, si se
+    cuelga o muere, solo se reemplaza ese worker: las conversiones de otros hilos siguen su curso.
+    """
+    def __init__(self, workers, memory_limit_mb):
+        self.memory_limit_mb = memory_limit_mb; self._lock = threading.Lock(); self._executors = set(); self._closed = False
+        self._idle = queue.LifoQueue()
+        for _ in range(workers): self._idle.put(self._new_executor())
+
+    def _new_executor(self):
+        # El proceso se crea en el primer submit
+        executor = ProcessPoolExecutor(max_workers=1, mp_context=_mp_context(), initializer=_init_worker, initargs=(self.memory_limit_mb,))
+        with self._lock: self._executors.add(executor)
+        return executor
+
+    def render(self, content_bytes, timeout_seconds):
+        executor = self._idle.get()
+        try:
+            future = executor.submit(_render_in_worker, content_bytes, timeout_seconds)
+            result = future.result(timeout=timeout_seconds + PARENT_TIMEOUT_GRACE_SECONDS)
+        except FutureTimeoutError:
+            self._replace(executor); return None, f"Tiempo de conversión agotado ({timeout_seconds}s)", False
+        except BrokenProcessPool:
+            self._replace(executor); return None, "El proceso de conversión terminó inesperadamente", False
+        except BaseException: self._idle.put(executor); raise
+        self._idle.put(executor); return result
+
+    def _replace(self, executor):
+        # Worker colgado o muerto (p.ej. OOM): se termina solo ese proceso y se pone uno nuevo en su lugar
+        with self._lock: self._executors.discard(executor)
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            try: process.terminate()
+            except Exception: pass
+        executor.shutdown(wait=False, cancel_futures=True)
+        if not self._closed: self._idle.put(self._new_executor())
+
+    def shutdown(self):
+        with self._lock: self._closed = True; executors = list(self._executors); self._executors.clear()
+        for executor in executors: executor.shutdown(wait=True, cancel_futures=True)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _get_pool(workers, memory_limit_mb):
+    key = (workers, memory_limit_mb)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None: pool = _pools[key] = _RenderPool(workers, memory_limit_mb)
+        return pool
+
+def shutdown_pools():
+    # Cierra los procesos de conversión y espera a que terminen (CLI, benchmarks)
+    with _pools_lock: pools = list(_pools.values()); _pools.clear()
+    for pool in pools: pool.shutdown()
+
+def _render(content_bytes, workers, timeout_seconds, memory_limit_mb):
+    # Devuelve (pdf_bytes, error, definitivo); los fallos definitivos dependen solo del HTML
+    try: return _get_pool(workers, memory_limit_mb).render(content_bytes, timeout_seconds)
+    except MemoryError: return None, "Límite de memoria de conversión excedido", False
+
+def render_html_to_pdf(content_bytes, workers=DEFAULT_PDF_WORKERS, timeout_seconds=DEFAULT_PDF_TIMEOUT_SECONDS,
+                       memory_limit_mb=DEFAULT_PDF_MEMORY_LIMIT_MB, cache=None):
+    """Convierte HTML a PDF en el pool de procesos. Devuelve (pdf_bytes, None) o (None, error).
+
+    Con `cache` (ver sugos/pdf_cache.py) un HTML ya convertido no vuelve a pasar por pisa, y un
+    HTML que falló de forma definitiva devuelve el error guardado sin reintentar.
+    """
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(content_bytes, RENDERER_VERSION); cached = cache.get(cache_key)
+        if cached is not None:
+            pdf_bytes, error = cached
+            return (pdf_bytes, None) if error is None else (None, f"{error} (fallo conocido en caché)")
+    pdf_bytes, error, definitive = _render(content_bytes, workers, timeout_seconds, memory_limit_mb)
+    if cache is not None:
+        if error is None: cache.put_pdf(cache_key, pdf_bytes)
+        elif definitive: cache.put_failure(cache_key, error)
+    return pdf_bytes, error
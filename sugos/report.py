@@ -0,0 +1,38 @@
+# --- Mensajes del Motor de Exportación ---
+# Los helpers informan con report.error/warning/success/info sin depender de Streamlit.
+# Cada hilo usa el reporter instalado para él (los pools del motor lo heredan del hilo que
+# los crea); por defecto los mensajes van al módulo logging.
+import logging
+import threading
+import contextlib
+
+logger = logging.getLogger("sugos")
+
+class LogReporter:
+    def error(self, message): logger.error(message)
+    def warning(self, message): logger.warning(message)
+    def success(self, message): logger.info(message)
+    def info(self, message): logger.info(message)
+
+_default_reporter = LogReporter()
+_thread_state = threading.local()
+
+def current():
+    return getattr(_thread_state, "reporter", None) or _default_reporter
+
+def install(reporter):
+    # Instala el reporter en el hilo actual; `attach_thread` permite al reporter preparar el hilo
+    # (p.ej. el contexto de script de Streamlit)
+    _thread_state.reporter = reporter
+    if reporter is not None and hasattr(reporter, "attach_thread"): reporter.attach_thread()
+
+@contextlib.contextmanager
+def using(reporter):
+    previous = getattr(_thread_state, "reporter", None); install(reporter)
+    try: yield reporter
+    finally: _thread_state.reporter = previous
+
+def error(message): current().error(message)
+def warning(message): current().warning(message)
+def success(message): current().success(message)
+def info(message): current().info(message)
@@ -0,0 +1,12 @@
+# --- Parámetros de Configuración ---
+# Cada entorno es una sección de secrets.toml (o un dict equivalente en la CLI) con claves opcionales
+# de rendimiento; estos helpers leen esas claves con un valor por defecto.
+from sugos.attachment_cache import DEFAULT_CACHE_DIR
+
+def get_config_number(config, key, default, cast=int, minimum=0):
+    try: value = cast(config.get(key, default))
+    except (TypeError, ValueError): value = default
+    return max(minimum, value)
+
+def get_cache_dir(config):
+    return config.get('cache_dir') or DEFAULT_CACHE_DIR
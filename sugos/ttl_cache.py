@@ -0,0 +1,43 @@
+# --- Memoización con TTL ---
+# Caché en memoria del proceso (sobrevive a los reruns de Streamlit porque el módulo se importa una vez).
+# Las claves son tuplas cuyo primer elemento es el ámbito (entorno + usuario) para poder invalidarlas juntas.
+import copy
+import time
+import threading
+
+DEFAULT_MAX_ENTRIES = 50000
+
+class TTLCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries; self._entries = {}; self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: return None
+            expires_at, value = entry
+            if expires_at <= time.time(): del self._entries[key]; return None
+        # Copia: quien llama puede modificar los dicts (p.ej. item["cedula"])
+        return copy.deepcopy(value)
+
+    def put(self, key, value, ttl_seconds):
+        if ttl_seconds <= 0: return
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (time.time() + ttl_seconds, value)
+            if len(self._entries) > self.max_entries: self._prune_locked()
+
+    def invalidate(self, scope):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == scope]: del self._entries[key]
+
+    def _prune_locked(self):
+        now = time.time()
+        for key in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]: del self._entries[key]
+        # Si sigue lleno, se descartan las entradas que caducan antes
+        excess = len(self._entries) - self.max_entries
+        if excess > 0:
+            for key in sorted(self._entries, key=lambda k: self._entries[k][0])[:excess]: del self._entries[key]
+
+# Listados de órdenes y detalles consultados al CRM
+crm_listings = TTLCache()
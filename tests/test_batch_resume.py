@@ -0,0 +1,47 @@
+# --- Reanudación de la exportación por lotes ---
+# Una cédula cuya consulta de Fase 1 falla no debe quedar marcada como completa en el manifiesto.
+import os
+
+from bench.mock_crm import MockCRM
+from sugos import report
+from sugos.batch import Manifest, MANIFEST_NAME, run_batch
+
+CEDULAS = ["10000000", "10000001", "10000002"]
+MOCK_SETTINGS = {"latency_ms": 1.0, "jitter_ms": 1.0, "orders_per_cedula": 1, "attachments_per_order": 1,
+                 "links_per_order": 1, "attachment_kb": 4, "link_pdf_ratio": 1.0}
+
+def batch_config(base_url, tmp_path):
+    return {"display_name": "Test", "api_base_url": base_url, "app_cfn": "test", "cache_dir": str(tmp_path / "cache"),
+            "attachment_cache_max_mb": 0, "pdf_cache_max_mb": 0, "listing_cache_ttl_seconds": 0, "http_max_retries": 0}
+
+def test_resume_after_phase1_failure(tmp_path):
+    output_dir = str(tmp_path / "salida")
+    with MockCRM(MOCK_SETTINGS) as crm, report.using(report.LogReporter()):
+        config = batch_config(crm.base_url, tmp_path)
+        crm.settings["fail_orders_for"] = {"10000001"}
+        processed, errors = run_batch(CEDULAS, config, "test", "test", output_dir)
+        assert (processed, errors) == (4, 1)
+        manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME)); manifest.close()
+        assert manifest.cedulas == {"10000000", "10000002"}
+        assert not os.path.exists(os.path.join(output_dir, "10000001"))
+
+        crm.settings["fail_orders_for"] = set()
+        processed, errors = run_batch(CEDULAS, config, "test", "test", output_dir)
+        assert (processed, errors) == (2, 0)
+        assert sorted(os.listdir(os.path.join(output_dir, "10000001"))) == ["10000001-1.pdf", "10000001-2.pdf"]
+
+def test_resume_after_crm_renumbering(tmp_path):
+    # Un elemento falla y, antes de reanudar, el CRM agrega anexos: la numeración de la cédula cambia
+    output_dir = str(tmp_path / "salida")
+    with MockCRM(dict(MOCK_SETTINGS, orders_per_cedula=2)) as crm, report.using(report.LogReporter()):
+        config = batch_config(crm.base_url, tmp_path)
+        crm.settings["fail_files"] = {"777-1-a0"}
+        assert run_batch(["777"], config, "test", "test", output_dir) == (3, 1)
+
+        crm.settings["fail_files"] = set(); crm.settings["attachments_per_order"] = 2
+        assert run_batch(["777"], config, "test", "test", output_dir) == (6, 0)
+        manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME)); manifest.close()
+        paths = [path for item_paths in manifest.items.values() for path in item_paths]
+        assert sorted(paths) == [f"777/777-{sequence}.pdf" for sequence in range(1, 7)]
+        assert sorted(os.listdir(os.path.join(output_dir, "777"))) == [f"777-{sequence}.pdf" for sequence in range(1, 7)]
+        assert manifest.cedulas == {"777"}
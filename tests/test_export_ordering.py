@@ -0,0 +1,40 @@
+# --- Numeración determinista del pipeline de exportación ---
+# Con latencia variable las descargas terminan en cualquier orden; los nombres `{cedula}-{n}{ext}`
+# y el reporte de links deben coincidir con los de una ejecución estrictamente secuencial.
+import zipfile
+
+from bench.mock_crm import MockCRM
+from sugos import report
+from sugos.archive import ExportArchive
+from sugos.crm import get_api_token
+from sugos.export import item_key, run_export_pipeline
+
+CEDULAS = [str(10_000_000 + index) for index in range(6)]
+MOCK_SETTINGS = {"latency_ms": 4.0, "jitter_ms": 4.0, "orders_per_cedula": 3, "attachments_per_order": 2,
+                 "links_per_order": 2, "attachment_kb": 4, "link_pdf_ratio": 1.0, "seed": 7}
+
+def export_names(base_url, tmp_path, workers):
+    config = {"display_name": "Test", "api_base_url": base_url, "app_cfn": "test", "cache_dir": str(tmp_path),
+              "attachment_cache_max_mb": 0, "pdf_cache_max_mb": 0, "listing_cache_ttl_seconds": 0,
+              "phase1_workers": workers, "phase2_workers": workers}
+    paths_by_item = {}
+    with report.using(report.LogReporter()):
+        token = get_api_token("test", "test", config, use_cache=False); assert token
+        with ExportArchive(config) as export_archive:
+            links, total_items, processed_count, error_count = run_export_pipeline(
+                token, CEDULAS, config, export_archive,
+                on_item_done=lambda item, zip_paths, success: paths_by_item.__setitem__(item_key(item), zip_paths))
+    names = set()
+    for part in export_archive.parts:
+        part.seek(0)
+        with zipfile.ZipFile(part) as zipf: names.update(zipf.namelist())
+        part.close()
+    assert error_count == 0 and processed_count == total_items
+    return paths_by_item, names, links
+
+def test_numbering_independent_of_completion_order(tmp_path):
+    with MockCRM(MOCK_SETTINGS) as crm:
+        sequential = export_names(crm.base_url, tmp_path / "secuencial", 1)
+        concurrent = export_names(crm.base_url, tmp_path / "concurrente", 8)
+    assert len(sequential[0]) == len(CEDULAS) * 3 * 4
+    assert concurrent == sequential